@@ -0,0 +1,85 @@
+# pylint: disable=missing-module-docstring, missing-function-docstring
+import json
+import random
+import time
+import uuid
+
+from argparse import ArgumentParser
+
+from tasklist.compression import BrotliCompressor, GzipCompressor, brotli
+from tasklist.routers.task import encode_compact_tasks
+
+
+def make_rows(count):
+    words = ['buy', 'call', 'fix', 'read', 'send', 'write', 'the', 'a', 'report']
+    return [
+        (
+            str(uuid.uuid4()),
+            ' '.join(random.choices(words, k=random.randint(3, 40))),
+            random.random() < 0.5,
+            random.choice([None, 'john_doe', 'jane_doe']),
+        )
+        for _ in range(count)
+    ]
+
+
+def encode_full(rows):
+    # Sent as a single body.
+    return [json.dumps({
+        uuid_: {'description': description, 'completed': completed, 'user': user}
+        for uuid_, description, completed, user in rows
+    }).encode()]
+
+
+def encode_compact(rows):
+    # Streamed in the chunks of the compact format, followed by the empty
+    # body that ends a StreamingResponse.
+    return [chunk.encode() for chunk in encode_compact_tasks(rows)] + [b'']
+
+
+def compress(chunks, compressor_factory):
+    # As the compression middleware does: each chunk is compressed and
+    # flushed as it is sent, and the stream is finished with the last one.
+    compressor = compressor_factory()
+    sent = [compressor.compress(chunk) for chunk in chunks]
+    sent[-1] += compressor.finish()
+    return sent
+
+
+def measure(name, chunks, compressor_factory, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        sent = compress(chunks, compressor_factory)
+    elapsed = (time.process_time() - start) / repeat
+    raw_size = sum(len(chunk) for chunk in chunks)
+    sent_size = sum(len(chunk) for chunk in sent)
+    print(
+        f'{name:<24} {raw_size:>10} {sent_size:>10} '
+        f'{100 * (1 - sent_size / raw_size):>7.1f}% {1000 * elapsed:>9.2f}'
+    )
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark task list response compression.')
+    parser.add_argument('--tasks', type=int, default=20000, help='Number of tasks')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement')
+    args = parser.parse_args()
+
+    rows = make_rows(args.tasks)
+    bodies = {'full': encode_full(rows), 'compact': encode_compact(rows)}
+    compressors = {f'gzip-{level}': (lambda level=level: GzipCompressor(level))
+                   for level in (1, 6, 9)}
+    if brotli is not None:
+        compressors.update({
+            f'br-{quality}': (lambda quality=quality: BrotliCompressor(quality))
+            for quality in (1, 4, 11)
+        })
+
+    print(f'{"body/encoding":<24} {"raw bytes":>10} {"sent":>10} {"saved":>8} {"cpu ms":>9}')
+    for body_name, chunks in bodies.items():
+        for compressor_name, compressor_factory in compressors.items():
+            measure(f'{body_name}/{compressor_name}', chunks, compressor_factory, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+DROP TABLE IF EXISTS task_changes;
+DROP TABLE IF EXISTS task_changes_horizon;
+DROP TABLE IF EXISTS task_changes_lock;
+DROP TABLE IF EXISTS task_changes_counter;
+
+-- seq is the sync token. It stays NULL until the writer, identified by its
+-- connection, assigns it from task_changes_counter just before committing,
+-- so that sequence numbers follow commit order.
+CREATE TABLE task_changes (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    seq BIGINT NULL,
+    writer BIGINT UNSIGNED NULL,
+    uuid BINARY(16) NOT NULL,
+    deleted BOOLEAN NOT NULL DEFAULT False,
+    changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE INDEX task_changes_seq (seq),
+    INDEX task_changes_writer (writer, seq),
+    INDEX task_changes_uuid (uuid),
+    INDEX task_changes_deleted_changed_at (deleted, changed_at)
+);
+
+CREATE TABLE task_changes_horizon (
+    id TINYINT PRIMARY KEY,
+    seq BIGINT NOT NULL
+);
+
+INSERT INTO task_changes_horizon VALUES (1, 0);
+
+CREATE TABLE task_changes_counter (
+    id TINYINT PRIMARY KEY,
+    seq BIGINT NOT NULL
+);
+
+-- Tasks that existed before the change log are synced as new ones.
+INSERT INTO task_changes (seq, uuid)
+SELECT ROW_NUMBER() OVER (ORDER BY uuid), uuid FROM tasks;
+
+INSERT INTO task_changes_counter SELECT 1, COUNT(*) FROM task_changes;
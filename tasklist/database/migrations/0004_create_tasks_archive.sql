@@ -0,0 +1,18 @@
+ALTER TABLE tasks
+    ADD COLUMN updated_at TIMESTAMP NOT NULL
+        DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    ADD INDEX tasks_completed_updated_at (completed, updated_at);
+
+DROP TABLE IF EXISTS tasks_archive;
+
+-- No foreign key on user, so that 0002 can still drop users when migrations
+-- are rerun; DBSession clears archived owners itself.
+CREATE TABLE tasks_archive (
+    uuid BINARY(16) PRIMARY KEY,
+    description NVARCHAR(1024),
+    completed BOOLEAN,
+    user NVARCHAR(40),
+    updated_at TIMESTAMP NOT NULL,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX tasks_archive_user (user)
+);
@@ -0,0 +1,12 @@
+DROP TABLE IF EXISTS user_deletions;
+
+-- Outlives the user row, so there is no foreign key to users.
+CREATE TABLE user_deletions (
+    username NVARCHAR(40) PRIMARY KEY,
+    status ENUM('pending', 'running', 'done', 'failed') NOT NULL,
+    tasks_total INT NOT NULL,
+    tasks_detached INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL
+        DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX user_deletions_status (status)
+);
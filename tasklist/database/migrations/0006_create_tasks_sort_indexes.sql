@@ -0,0 +1,5 @@
+-- Lets the common task listing sorts, such as `user,-completed` and
+-- `completed,user`, read rows in index order instead of sorting them.
+ALTER TABLE tasks
+    ADD INDEX tasks_user_completed (user, completed DESC),
+    ADD INDEX tasks_completed_user (completed, user);
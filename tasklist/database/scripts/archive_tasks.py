@@ -0,0 +1,50 @@
+import time
+
+from argparse import ArgumentParser
+
+from utils.utils import connect
+
+from tasklist.database import DBSession
+
+
+def main():
+    parser = ArgumentParser(description='Move old completed tasks to the archive.')
+    parser.add_argument('config', help='Service config file')
+    parser.add_argument('secrets', help='Service database admin secrets')
+    parser.add_argument(
+        '--days',
+        type=int,
+        default=30,
+        help='Archive tasks completed more than this many days ago',
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=500,
+        help='Tasks moved per transaction',
+    )
+    parser.add_argument(
+        '--pause',
+        type=float,
+        default=0.1,
+        help='Seconds to wait between batches',
+    )
+
+    args = parser.parse_args()
+    connection = connect(args.config, args.secrets)
+    total = 0
+    try:
+        session = DBSession(connection)
+        while True:
+            moved = session.archive_completed_tasks(args.days, args.batch_size)
+            total += moved
+            if moved < args.batch_size:
+                break
+            time.sleep(args.pause)
+    finally:
+        connection.close()
+    print(f'Archived {total} tasks.')
+
+
+if __name__ == '__main__':
+    main()
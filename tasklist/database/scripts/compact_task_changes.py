@@ -0,0 +1,29 @@
+from argparse import ArgumentParser
+
+from utils.utils import connect
+
+from tasklist.database import DBSession
+
+
+def main():
+    parser = ArgumentParser(description='Trim old tombstones from the task change log.')
+    parser.add_argument('config', help='Service config file')
+    parser.add_argument('secrets', help='Service database admin secrets')
+    parser.add_argument(
+        '--days',
+        type=int,
+        default=30,
+        help='Keep tombstones younger than this many days',
+    )
+
+    args = parser.parse_args()
+    connection = connect(args.config, args.secrets)
+    try:
+        removed = DBSession(connection).compact_task_changes(args.days)
+    finally:
+        connection.close()
+    print(f'Removed {removed} tombstones.')
+
+
+if __name__ == '__main__':
+    main()
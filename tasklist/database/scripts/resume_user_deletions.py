@@ -0,0 +1,31 @@
+from argparse import ArgumentParser
+
+from utils.utils import connect
+
+from tasklist.database import DBSession
+
+
+def main():
+    parser = ArgumentParser(description='Finish user deletions that were interrupted.')
+    parser.add_argument('config', help='Service config file')
+    parser.add_argument('secrets', help='Service database admin secrets')
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=500,
+        help='Tasks detached per transaction',
+    )
+
+    args = parser.parse_args()
+    connection = connect(args.config, args.secrets)
+    try:
+        session = DBSession(connection)
+        for username in session.read_unfinished_user_deletions():
+            session.run_user_deletion(username, args.chunk_size)
+            print(f'Deleted user {username}.')
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# pylint: disable=missing-module-docstring, missing-function-docstring
+import os
+
+from argparse import ArgumentParser
+
+
+def serve(args):
+    # Imported here so that other commands do not require uvicorn.
+    import uvicorn  # pylint: disable=import-outside-toplevel
+
+    # With more than one worker uvicorn binds the socket once and shares it
+    # with the worker processes.
+    uvicorn.run(
+        'tasklist.main:app',
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=args.loop,
+        http=args.http,
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        limit_concurrency=args.limit_concurrency,
+    )
+
+
+def main():
+    parser = ArgumentParser(prog='tasklist', description='Task list service.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help='Run the API server')
+    serve_parser.add_argument('--host', default='127.0.0.1', help='Address to bind')
+    serve_parser.add_argument('--port', type=int, default=8000, help='Port to bind')
+    serve_parser.add_argument(
+        '--workers',
+        type=int,
+        default=os.cpu_count() or 1,
+        help='Number of worker processes (default: CPU count)',
+    )
+    serve_parser.add_argument(
+        '--loop',
+        choices=['auto', 'asyncio', 'uvloop'],
+        default='auto',
+        help='Event loop implementation',
+    )
+    serve_parser.add_argument(
+        '--http',
+        choices=['auto', 'h11', 'httptools'],
+        default='auto',
+        help='HTTP protocol implementation',
+    )
+    serve_parser.add_argument(
+        '--backlog',
+        type=int,
+        default=2048,
+        help='Maximum number of pending connections',
+    )
+    serve_parser.add_argument(
+        '--keep-alive',
+        type=int,
+        default=5,
+        help='Seconds to keep idle connections open',
+    )
+    serve_parser.add_argument(
+        '--graceful-timeout',
+        type=int,
+        default=30,
+        help='Seconds to wait for in-flight requests on shutdown',
+    )
+    serve_parser.add_argument(
+        '--limit-concurrency',
+        type=int,
+        default=None,
+        help='Maximum concurrent connections per worker before returning 503',
+    )
+    serve_parser.set_defaults(handler=serve)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# pylint: disable=missing-module-docstring, missing-function-docstring, missing-class-docstring
+import functools
+import threading
+
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Shares one execution of a call among all concurrent callers with the
+    same key."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.executed = 0
+        self.collapsed = 0
+        self.invalidations = 0
+
+    def do(self, key, function):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = Future()
+                self.calls[key] = call
+                self.executed += 1
+            else:
+                self.collapsed += 1
+
+        if not leader:
+            return call.result()
+
+        try:
+            result = function()
+        except BaseException as exception:
+            call.set_exception(exception)
+            raise
+        else:
+            call.set_result(result)
+        finally:
+            with self.lock:
+                if self.calls.get(key) is call:
+                    del self.calls[key]
+        return result
+
+    def invalidate(self):
+        # Callers already waiting keep the in-flight result, as they arrived
+        # before the write finished. Later callers start a new query.
+        with self.lock:
+            self.calls.clear()
+            self.invalidations += 1
+
+    def metrics(self):
+        return {
+            'executed': self.executed,
+            'collapsed': self.collapsed,
+            'invalidations': self.invalidations,
+        }
+
+
+def coalesced(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.single_flight is None:
+            return method(self, *args, **kwargs)
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        return self.single_flight.do(key, lambda: method(self, *args, **kwargs))
+    return wrapper
+
+
+def invalidates(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            if self.single_flight is not None:
+                self.single_flight.invalidate()
+    return wrapper
@@ -0,0 +1,154 @@
+# pylint: disable=missing-module-docstring, missing-function-docstring, missing-class-docstring
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+
+class GzipCompressor:
+    def __init__(self, level: int):
+        # wbits=31 makes zlib write a gzip container instead of raw deflate.
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes):
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, quality: int):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes):
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+def get_accepted_encodings(accept_encoding: str):
+    encodings = set()
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name and quality > 0:
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+class CompressionMiddleware:
+    """Compresses responses with brotli or gzip, depending on what the client
+    accepts. Bodies sent in several chunks are compressed as they stream."""
+
+    def __init__(self, app, minimum_size=500, gzip_level=6, brotli_quality=4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        encodings = get_accepted_encodings(
+            Headers(scope=scope).get('accept-encoding', ''),
+        )
+        if brotli is not None and 'br' in encodings:
+            responder = _CompressionResponder(
+                self.app,
+                'br',
+                lambda: BrotliCompressor(self.brotli_quality),
+                self.minimum_size,
+            )
+        elif 'gzip' in encodings:
+            responder = _CompressionResponder(
+                self.app,
+                'gzip',
+                lambda: GzipCompressor(self.gzip_level),
+                self.minimum_size,
+            )
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        await responder(scope, receive, send)
+
+
+class _CompressionResponder:
+    def __init__(self, app, encoding, compressor_factory, minimum_size):
+        self.app = app
+        self.encoding = encoding
+        self.compressor_factory = compressor_factory
+        self.minimum_size = minimum_size
+        self.send = None
+        self.start_message = None
+        self.compressor = None
+        self.passthrough = False
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message):
+        if message['type'] == 'http.response.start':
+            # Wait for the first body chunk to know whether to compress.
+            self.start_message = message
+            self.passthrough = 'content-encoding' in Headers(raw=message['headers'])
+            return
+
+        if message['type'] != 'http.response.body' or self.passthrough:
+            if self.start_message is not None:
+                await self.send(self.start_message)
+                self.start_message = None
+            await self.send(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+
+        if self.start_message is not None:
+            start_message = self.start_message
+            self.start_message = None
+
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self.send(start_message)
+                await self.send(message)
+                return
+
+            self.compressor = self.compressor_factory()
+            headers = MutableHeaders(raw=start_message['headers'])
+            headers['Content-Encoding'] = self.encoding
+            headers.add_vary_header('Accept-Encoding')
+
+            if not more_body:
+                body = self.compressor.compress(body) + self.compressor.finish()
+                headers['Content-Length'] = str(len(body))
+                await self.send(start_message)
+                await self.send({'type': 'http.response.body', 'body': body})
+                return
+
+            del headers['Content-Length']
+            await self.send(start_message)
+
+        body = self.compressor.compress(body)
+        if not more_body:
+            body += self.compressor.finish()
+        await self.send({
+            'type': 'http.response.body',
+            'body': body,
+            'more_body': more_body,
+        })
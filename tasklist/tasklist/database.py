@@ -1,103 +1,363 @@
 # pylint: disable=missing-module-docstring, missing-function-docstring, missing-class-docstring
 import json
+import logging
+import math
+import os
+import threading
+import time
 import uuid
 
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
+from itertools import groupby
+from typing import Iterable, List, Tuple
 
 import mysql.connector as conn
 
-from fastapi import Depends
+from fastapi import Depends, HTTPException
 
 from utils.utils import get_config_filename, get_app_secrets_filename
 
-from .models import Task, User
+from . import metrics
+from .coalescing import SingleFlight, coalesced, invalidates
+from .models import Task, TaskChange, TaskChanges, User, UserDeletion
+from .overload import AdmissionQueue, CircuitBreaker, is_overload_error
+
+
+TASK_FIELDS = ('description', 'completed', 'user')
+
+# Coalescing saves the query, not the connection: get_db connects before the
+# route runs, so callers waiting on a shared read still hold their own.
+READS = SingleFlight()
+metrics.register('coalesced_reads', READS.metrics)
+
+
+UUID7_LOCK = threading.Lock()
+last_uuid7 = 0  # pylint: disable=invalid-name
+
+
+def uuid7():
+    # Time-ordered UUID (RFC 9562 version 7): a 48-bit millisecond timestamp
+    # followed by 74 random bits, so new keys append to the clustered index.
+    # Within a millisecond the previous random bits are incremented by a
+    # random amount instead (RFC 9562 monotonic random), so that the UUIDs of
+    # a process always increase.
+    global last_uuid7  # pylint: disable=global-statement, invalid-name
+    value = (time.time_ns() // 1_000_000 & 0xFFFF_FFFF_FFFF) << 74
+    value |= int.from_bytes(os.urandom(10), 'big') >> 6
+    with UUID7_LOCK:
+        if value <= last_uuid7:
+            value = last_uuid7 + 1 + int.from_bytes(os.urandom(4), 'big')
+        last_uuid7 = value
+
+    # Layout: timestamp, version, 12 random bits, variant, 62 random bits.
+    return uuid.UUID(int=(
+        (value >> 74) << 80
+        | 0x7 << 76
+        | (value >> 62 & 0xFFF) << 64
+        | 0x2 << 62
+        | value & (1 << 62) - 1
+    ))
+
+
+def bin_to_uuid(value):
+    return uuid.UUID(bytes=bytes(value))
 
 
 class DBSession:
-    def __init__(self, connection: conn.MySQLConnection):
+    def __init__(
+            self,
+            connection: conn.MySQLConnection,
+            time_ordered_uuids: bool = False,
+            single_flight: SingleFlight = None,
+    ):
         self.connection = connection
+        self.single_flight = single_flight
+        self.new_uuid = uuid7 if time_ordered_uuids else uuid.uuid4
 
-    def read_tasks(self, completed: bool = None):
-        query = 'SELECT BIN_TO_UUID(uuid), description, completed, user FROM tasks'
+    def set_max_execution_time(self, milliseconds: int):
+        # Only applies to read-only SELECT statements.
+        with self.connection.cursor() as cursor:
+            cursor.execute('SET SESSION max_execution_time = %s', (milliseconds, ))
+
+    def ping(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+
+    @coalesced
+    def read_task_rows(
+            self,
+            completed: bool = None,
+            include_archived: bool = False,
+            fields: Tuple[str, ...] = TASK_FIELDS,
+            sort: Tuple[str, ...] = (),
+    ):
+        # Field and sort names are checked against TASK_FIELDS by the caller,
+        # which is what makes formatting them into the query safe. MySQL only
+        # sorts a UNION by selected columns, so sort keys left out of the
+        # fields are selected too and dropped from the results.
+        selected = ('uuid', ) + tuple(fields)
+        columns = ', '.join(selected + tuple(dict.fromkeys(
+            key.lstrip('-') for key in sort if key.lstrip('-') not in selected
+        )))
+        query = f'SELECT {columns} FROM tasks'
         if completed is not None:
             query += ' WHERE completed = '
             if completed:
                 query += 'True'
             else:
                 query += 'False'
+        # Only completed tasks get archived.
+        if include_archived and completed is not False:
+            query += f' UNION ALL SELECT {columns} FROM tasks_archive'
+        if sort:
+            query += ' ORDER BY ' + ', '.join(
+                f'{key[1:]} DESC' if key.startswith('-') else f'{key} ASC'
+                for key in sort
+            )
 
         with self.connection.cursor() as cursor:
             cursor.execute(query)
             db_results = cursor.fetchall()
 
-        return {
-            uuid_: Task(
-                description=field_description,
-                completed=bool(field_completed),
-                user=field_user
+        return [
+            (bin_to_uuid(uuid_), ) + tuple(
+                bool(value) if field == 'completed' else value
+                for field, value in zip(fields, values[:len(fields)])
             )
-            for uuid_, field_description, field_completed, field_user in db_results
+            for uuid_, *values in db_results
+        ]
+
+    def read_tasks(
+            self,
+            completed: bool = None,
+            include_archived: bool = False,
+            fields: Tuple[str, ...] = TASK_FIELDS,
+            sort: Tuple[str, ...] = (),
+    ):
+        return {
+            uuid_: Task(**dict(zip(fields, values)))
+            for uuid_, *values
+            in self.read_task_rows(completed, include_archived, fields, sort)
         }
 
+    @invalidates
     def create_task(self, item: Task):
-        uuid_ = uuid.uuid4()
+        uuid_ = self.new_uuid()
 
         with self.connection.cursor() as cursor:
             cursor.execute(
-                'INSERT INTO tasks VALUES (UUID_TO_BIN(%s), %s, %s, %s)',
-                (str(uuid_), item.description, item.completed, item.user),
+                '''
+                INSERT INTO tasks (uuid, description, completed, user)
+                VALUES (%s, %s, %s, %s)
+                ''',
+                (uuid_.bytes, item.description, item.completed, item.user),
             )
+            self.__log_task_change(cursor, uuid_)
+            self.__sequence_task_changes(cursor)
         self.connection.commit()
 
         return uuid_
 
+    @coalesced
     def read_task(self, uuid_: uuid.UUID):
-        if not self.__task_exists(uuid_):
-            raise KeyError()
-
         with self.connection.cursor() as cursor:
-            cursor.execute(
-                '''
-                SELECT description, completed, user
-                FROM tasks
-                WHERE uuid = UUID_TO_BIN(%s)
-                ''',
-                (str(uuid_), ),
-            )
-            result = cursor.fetchone()
+            for table in ('tasks', 'tasks_archive'):
+                cursor.execute(
+                    f'''
+                    SELECT description, completed, user
+                    FROM {table}
+                    WHERE uuid = %s
+                    ''',
+                    (uuid_.bytes, ),
+                )
+                result = cursor.fetchone()
+                if result is not None:
+                    return Task(
+                        description=result[0],
+                        completed=bool(result[1]),
+                        user=result[2],
+                    )
 
-        return Task(description=result[0], completed=bool(result[1]), user=result[2])
+        raise KeyError()
 
+    @invalidates
     def replace_task(self, uuid_, item):
-        if not self.__task_exists(uuid_):
+        archived = not self.__task_exists(uuid_)
+        if archived and not self.__task_exists(uuid_, 'tasks_archive'):
             raise KeyError()
 
         with self.connection.cursor() as cursor:
+            if archived:
+                self.__restore_task(uuid_)
             cursor.execute(
                 '''
                 UPDATE tasks SET description=%s, completed=%s, user=%s
-                WHERE uuid=UUID_TO_BIN(%s)
+                WHERE uuid=%s
                 ''',
-                (item.description, item.completed, item.user, str(uuid_)),
+                (item.description, item.completed, item.user, uuid_.bytes),
             )
+            self.__log_task_change(cursor, uuid_)
+            self.__sequence_task_changes(cursor)
         self.connection.commit()
 
+    @invalidates
     def remove_task(self, uuid_):
+        table = 'tasks'
         if not self.__task_exists(uuid_):
-            raise KeyError()
+            table = 'tasks_archive'
+            if not self.__task_exists(uuid_, table):
+                raise KeyError()
 
         with self.connection.cursor() as cursor:
             cursor.execute(
-                'DELETE FROM tasks WHERE uuid=UUID_TO_BIN(%s)',
-                (str(uuid_), ),
+                f'DELETE FROM {table} WHERE uuid=%s',
+                (uuid_.bytes, ),
             )
+            self.__log_task_change(cursor, uuid_, deleted=True)
+            self.__sequence_task_changes(cursor)
         self.connection.commit()
 
+    @invalidates
     def remove_all_tasks(self):
         with self.connection.cursor() as cursor:
-            cursor.execute('DELETE FROM tasks')
+            for table in ('tasks', 'tasks_archive'):
+                cursor.execute(
+                    f'''
+                    DELETE task_changes FROM task_changes
+                    JOIN {table} ON {table}.uuid = task_changes.uuid
+                    '''
+                )
+                cursor.execute(
+                    f'''
+                    INSERT INTO task_changes (uuid, deleted, writer)
+                    SELECT uuid, True, CONNECTION_ID() FROM {table}
+                    '''
+                )
+                cursor.execute(f'DELETE FROM {table}')
+            self.__sequence_task_changes(cursor)
         self.connection.commit()
 
+    @invalidates
+    def archive_completed_tasks(self, max_age_days: int, batch_size: int = 500):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                '''
+                SELECT uuid FROM tasks
+                WHERE completed = True
+                AND updated_at < NOW() - INTERVAL %s DAY
+                ORDER BY updated_at
+                LIMIT %s
+                FOR UPDATE
+                ''',
+                (max_age_days, batch_size),
+            )
+            uuids = [uuid_ for uuid_, in cursor.fetchall()]
+            if not uuids:
+                self.connection.commit()
+                return 0
+
+            placeholders = ', '.join(['%s'] * len(uuids))
+            cursor.execute(
+                f'''
+                INSERT INTO tasks_archive (uuid, description, completed, user, updated_at)
+                SELECT uuid, description, completed, user, updated_at
+                FROM tasks WHERE uuid IN ({placeholders})
+                ''',
+                uuids,
+            )
+            cursor.execute(
+                f'DELETE FROM tasks WHERE uuid IN ({placeholders})',
+                uuids,
+            )
+        self.connection.commit()
+
+        return len(uuids)
+
+    @coalesced
+    def read_task_changes(self, since: int = 0, limit: int = 100):
+        with self.connection.cursor() as cursor:
+            cursor.execute('SELECT seq FROM task_changes_horizon WHERE id = 1')
+            horizon = cursor.fetchone()[0]
+            if 0 < since < horizon:
+                raise ValueError()
+
+            cursor.execute(
+                '''
+                SELECT
+                    task_changes.seq,
+                    task_changes.uuid,
+                    task_changes.deleted,
+                    COALESCE(tasks.description, tasks_archive.description),
+                    COALESCE(tasks.completed, tasks_archive.completed),
+                    COALESCE(tasks.user, tasks_archive.user)
+                FROM task_changes
+                LEFT JOIN tasks ON tasks.uuid = task_changes.uuid
+                LEFT JOIN tasks_archive ON tasks_archive.uuid = task_changes.uuid
+                WHERE task_changes.seq > %s
+                ORDER BY task_changes.seq
+                LIMIT %s
+                ''',
+                (since, limit + 1),
+            )
+            db_results = cursor.fetchall()
+
+        has_more = len(db_results) > limit
+        db_results = db_results[:limit]
+
+        changes = [
+            TaskChange(
+                uuid=bin_to_uuid(uuid_),
+                deleted=bool(field_deleted),
+                task=None if field_deleted else Task(
+                    description=field_description,
+                    completed=bool(field_completed),
+                    user=field_user,
+                ),
+            )
+            for _, uuid_, field_deleted, field_description, field_completed, field_user
+            in db_results
+        ]
+        token = db_results[-1][0] if db_results else since
+
+        return TaskChanges(changes=changes, token=token, has_more=has_more)
+
+    @invalidates
+    def compact_task_changes(self, max_age_days: int):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                '''
+                SELECT MAX(seq) FROM task_changes
+                WHERE deleted = True
+                AND changed_at < NOW() - INTERVAL %s DAY
+                ''',
+                (max_age_days, ),
+            )
+            horizon = cursor.fetchone()[0]
+            if horizon is None:
+                return 0
+
+            cursor.execute(
+                '''
+                DELETE FROM task_changes
+                WHERE deleted = True AND seq <= %s
+                ''',
+                (horizon, ),
+            )
+            removed = cursor.rowcount
+            cursor.execute(
+                '''
+                UPDATE task_changes_horizon SET seq = GREATEST(seq, %s)
+                WHERE id = 1
+                ''',
+                (horizon, ),
+            )
+        self.connection.commit()
+
+        return removed
+
+    @coalesced
     def read_user(self, username: str):
         if not self.__user_exists(username):
             raise KeyError()
@@ -115,6 +375,7 @@ class DBSession:
 
         return User(first_name=result[0], last_name=result[1], username=username)
 
+    @invalidates
     def create_user(self, user: User):
 
         with self.connection.cursor() as cursor:
@@ -126,6 +387,60 @@ class DBSession:
 
         return user.username
 
+    @invalidates
+    def upsert_users(self, users: List[User], batch_size: int = 1000):
+        # Existing users only get the names the client sent; the defaults of
+        # the omitted ones are for new users. Consecutive users that sent the
+        # same names share a statement, keeping the order of the request.
+        runs = groupby(
+            users,
+            key=lambda user: tuple(
+                name for name in ('first_name', 'last_name')
+                if name in user.dict(exclude_unset=True)
+            ),
+        )
+        with self.connection.cursor() as cursor:
+            for names, run in runs:
+                run = list(run)
+                updates = ', '.join(
+                    '{0} = VALUES({0})'.format(name)
+                    for name in names or ('username', )
+                )
+                for start in range(0, len(run), batch_size):
+                    batch = run[start:start + batch_size]
+                    cursor.execute(
+                        '''
+                        INSERT INTO users (username, first_name, last_name)
+                        VALUES {}
+                        ON DUPLICATE KEY UPDATE {}
+                        '''.format(', '.join(['(%s, %s, %s)'] * len(batch)), updates),
+                        [
+                            field
+                            for user in batch
+                            for field in (user.username, user.first_name, user.last_name)
+                        ],
+                    )
+        self.connection.commit()
+
+        return [user.username for user in users]
+
+    def users_exist(self, usernames: Iterable[str], batch_size: int = 1000):
+        usernames = list(set(usernames))
+        found = set()
+        with self.connection.cursor() as cursor:
+            for start in range(0, len(usernames), batch_size):
+                batch = usernames[start:start + batch_size]
+                cursor.execute(
+                    'SELECT username FROM users WHERE username IN ({})'.format(
+                        ', '.join(['%s'] * len(batch)),
+                    ),
+                    batch,
+                )
+                found.update(username for username, in cursor.fetchall())
+
+        return found
+
+    @invalidates
     def replace_user(self, username: str, user: User):
         if not self.__user_exists(username):
             raise KeyError()
@@ -140,37 +455,284 @@ class DBSession:
             )
         self.connection.commit()
 
+    @invalidates
     def remove_user(self, username: str):
         if not self.__user_exists(username):
             raise KeyError()
 
         with self.connection.cursor() as cursor:
+            # Tasks lose their owner through ON DELETE SET NULL, which has to
+            # show up in the change log as well. Archived tasks have no
+            # foreign key and are detached here.
+            for table in ('tasks', 'tasks_archive'):
+                cursor.execute(
+                    f'''
+                    DELETE task_changes FROM task_changes
+                    JOIN {table} ON {table}.uuid = task_changes.uuid
+                    WHERE {table}.user = %s
+                    ''',
+                    (username, ),
+                )
+                cursor.execute(
+                    f'''
+                    INSERT INTO task_changes (uuid, writer)
+                    SELECT uuid, CONNECTION_ID() FROM {table} WHERE user = %s
+                    ''',
+                    (username, ),
+                )
+            cursor.execute(
+                'UPDATE tasks_archive SET user = NULL WHERE user = %s',
+                (username, ),
+            )
             cursor.execute(
                 'DELETE FROM users WHERE username=%s',
                 (username, ),
             )
+            self.__sequence_task_changes(cursor)
+        self.connection.commit()
+
+    def start_user_deletion(self, username: str):
+        if not self.__user_exists(username):
+            raise KeyError()
+
+        with self.connection.cursor() as cursor:
+            # Locks the deletion, if any, so that only one job runs at once.
+            cursor.execute(
+                'SELECT status FROM user_deletions WHERE username=%s FOR UPDATE',
+                (username, ),
+            )
+            result = cursor.fetchone()
+            if result is not None and result[0] in ('pending', 'running'):
+                self.connection.rollback()
+                raise ValueError()
+
+            cursor.execute(
+                '''
+                SELECT
+                    (SELECT COUNT(*) FROM tasks WHERE user = %s)
+                    + (SELECT COUNT(*) FROM tasks_archive WHERE user = %s)
+                ''',
+                (username, username),
+            )
+            tasks_total = cursor.fetchone()[0]
+            cursor.execute(
+                '''
+                INSERT INTO user_deletions (username, status, tasks_total)
+                VALUES (%s, 'pending', %s)
+                ON DUPLICATE KEY UPDATE
+                    status = 'pending',
+                    tasks_total = VALUES(tasks_total),
+                    tasks_detached = 0
+                ''',
+                (username, tasks_total),
+            )
         self.connection.commit()
 
+        return UserDeletion(username=username, tasks_total=tasks_total)
+
+    def read_user_deletion(self, username: str):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                '''
+                SELECT status, tasks_total, tasks_detached
+                FROM user_deletions
+                WHERE username=%s
+                ''',
+                (username, ),
+            )
+            result = cursor.fetchone()
+
+        if result is None:
+            raise KeyError()
+
+        return UserDeletion(
+            username=username,
+            status=result[0],
+            tasks_total=result[1],
+            tasks_detached=result[2],
+        )
+
+    def read_unfinished_user_deletions(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT username FROM user_deletions WHERE status <> 'done'"
+            )
+            return [username for username, in cursor.fetchall()]
+
+    @invalidates
+    def run_user_deletion(self, username: str, chunk_size: int = 500):
+        # Tasks are detached in short transactions before the user row goes,
+        # so that ON DELETE SET NULL has nothing left to rewrite. Safe to
+        # rerun after a failure.
+        self.__set_user_deletion_status(username, 'running')
+        try:
+            for table in ('tasks', 'tasks_archive'):
+                while True:
+                    with self.connection.cursor() as cursor:
+                        detached = self.__detach_tasks(cursor, table, username, chunk_size)
+                        cursor.execute(
+                            '''
+                            UPDATE user_deletions
+                            SET tasks_detached = tasks_detached + %s
+                            WHERE username=%s
+                            ''',
+                            (detached, username),
+                        )
+                        self.__sequence_task_changes(cursor)
+                    self.connection.commit()
+                    if detached < chunk_size:
+                        break
+
+            with self.connection.cursor() as cursor:
+                cursor.execute(
+                    'DELETE FROM users WHERE username=%s',
+                    (username, ),
+                )
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            self.__set_user_deletion_status(username, 'failed')
+            raise
+
+        self.__set_user_deletion_status(username, 'done')
+
+    @invalidates
     def remove_all_users(self):
         with self.connection.cursor() as cursor:
+            for table in ('tasks', 'tasks_archive'):
+                cursor.execute(
+                    f'''
+                    DELETE task_changes FROM task_changes
+                    JOIN {table} ON {table}.uuid = task_changes.uuid
+                    WHERE {table}.user IS NOT NULL
+                    '''
+                )
+                cursor.execute(
+                    f'''
+                    INSERT INTO task_changes (uuid, writer)
+                    SELECT uuid, CONNECTION_ID() FROM {table} WHERE user IS NOT NULL
+                    '''
+                )
+            cursor.execute('UPDATE tasks_archive SET user = NULL')
             cursor.execute('DELETE FROM users')
+            self.__sequence_task_changes(cursor)
         self.connection.commit()
 
-    def __task_exists(self, uuid_: uuid.UUID):
+    def __task_exists(self, uuid_: uuid.UUID, table: str = 'tasks'):
         with self.connection.cursor() as cursor:
             cursor.execute(
-                '''
+                f'''
                 SELECT EXISTS(
-                    SELECT 1 FROM tasks WHERE uuid=UUID_TO_BIN(%s)
+                    SELECT 1 FROM {table} WHERE uuid=%s
                 )
                 ''',
-                (str(uuid_), ),
+                (uuid_.bytes, ),
             )
             results = cursor.fetchone()
             found = bool(results[0])
 
         return found
 
+    @staticmethod
+    def __detach_tasks(cursor, table: str, username: str, limit: int):
+        cursor.execute(
+            f'SELECT uuid FROM {table} WHERE user = %s LIMIT %s FOR UPDATE',
+            (username, limit),
+        )
+        uuids = [uuid_ for uuid_, in cursor.fetchall()]
+        if not uuids:
+            return 0
+
+        placeholders = ', '.join(['%s'] * len(uuids))
+        cursor.execute(
+            f'DELETE FROM task_changes WHERE uuid IN ({placeholders})',
+            uuids,
+        )
+        cursor.execute(
+            'INSERT INTO task_changes (uuid, writer) VALUES {}'.format(
+                ', '.join(['(%s, CONNECTION_ID())'] * len(uuids)),
+            ),
+            uuids,
+        )
+        cursor.execute(
+            f'UPDATE {table} SET user = NULL WHERE uuid IN ({placeholders})',
+            uuids,
+        )
+
+        return len(uuids)
+
+    def __set_user_deletion_status(self, username: str, status: str):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE user_deletions SET status=%s WHERE username=%s',
+                (status, username),
+            )
+        self.connection.commit()
+
+    def __restore_task(self, uuid_: uuid.UUID):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                '''
+                INSERT INTO tasks (uuid, description, completed, user)
+                SELECT uuid, description, completed, user
+                FROM tasks_archive WHERE uuid=%s
+                ''',
+                (uuid_.bytes, ),
+            )
+            cursor.execute(
+                'DELETE FROM tasks_archive WHERE uuid=%s',
+                (uuid_.bytes, ),
+            )
+
+    @staticmethod
+    def __sequence_task_changes(cursor, batch_size: int = 1000):
+        # Run last, just before the commit. Sequence numbers handed out as
+        # rows were inserted could commit out of order, and a sync taking
+        # the later one as its token would skip the other change for good.
+        # Taking them from the counter row instead keeps it locked only
+        # between this update and the commit, so they follow commit order.
+        cursor.execute(
+            '''
+            SELECT id FROM task_changes
+            WHERE writer = CONNECTION_ID() AND seq IS NULL
+            ORDER BY id
+            '''
+        )
+        ids = [id_ for id_, in cursor.fetchall()]
+        if not ids:
+            return
+
+        cursor.execute(
+            'UPDATE task_changes_counter SET seq = LAST_INSERT_ID(seq + %s) WHERE id = 1',
+            (len(ids), ),
+        )
+        cursor.execute('SELECT LAST_INSERT_ID()')
+        first_seq = cursor.fetchone()[0] - len(ids) + 1
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(
+                f'''
+                UPDATE task_changes
+                SET seq = %s + FIELD(id, {placeholders}) - 1, writer = NULL
+                WHERE id IN ({placeholders})
+                ''',
+                [first_seq + start, *batch, *batch],
+            )
+
+    @staticmethod
+    def __log_task_change(cursor, uuid_: uuid.UUID, deleted: bool = False):
+        # Only the latest change of each task is kept, so a sync never has to
+        # page through superseded entries.
+        cursor.execute(
+            'DELETE FROM task_changes WHERE uuid=%s',
+            (uuid_.bytes, ),
+        )
+        cursor.execute(
+            'INSERT INTO task_changes (uuid, deleted, writer) VALUES (%s, %s, CONNECTION_ID())',
+            (uuid_.bytes, deleted),
+        )
+
     def __user_exists(self, username: str):
         with self.connection.cursor() as cursor:
             cursor.execute(
@@ -187,6 +749,12 @@ class DBSession:
         return found
 
 
+@lru_cache
+def get_config(config_file_name: str = Depends(get_config_filename)):
+    with open(config_file_name, 'r') as file:
+        return json.load(file)
+
+
 @lru_cache
 def get_credentials(
         config_file_name: str = Depends(get_config_filename),
@@ -201,12 +769,113 @@ def get_credentials(
         'password': secrets['password'],
         'host': config['db_host'],
         'database': config['database'],
+        'connection_timeout': config.get('db_limits', {}).get('connect_timeout', 10),
     }
 
 
-def get_db(credentials: dict = Depends(get_credentials)):
+@lru_cache
+def get_db_guards(config_file_name: str = Depends(get_config_filename)):
+    with open(config_file_name, 'r') as file:
+        limits = json.load(file).get('db_limits', {})
+    breaker = CircuitBreaker(
+        failure_threshold=limits.get('failure_threshold', 5),
+        slow_call_seconds=limits.get('slow_call_seconds', 2.0),
+        reset_timeout=limits.get('reset_timeout', 10.0),
+    )
+    admission = AdmissionQueue(
+        max_in_flight=limits.get('max_in_flight', 32),
+        max_queue=limits.get('max_queue', 64),
+        timeout=limits.get('queue_timeout', 1.0),
+    )
+    metrics.register('database', lambda: {
+        'circuit_breaker': breaker.metrics(),
+        'admission': admission.metrics(),
+    })
+    return breaker, admission
+
+
+async def admit_db_request(guards: tuple = Depends(get_db_guards)):
+    # Async, so that requests wait for admission on the event loop instead of
+    # holding a threadpool thread.
+    _, admission = guards
+    if not await admission.acquire():
+        raise HTTPException(
+            status_code=503,
+            detail='Too many database requests',
+            headers={'Retry-After': '1'},
+        )
+    try:
+        yield
+    finally:
+        admission.release()
+
+
+def get_db(
+        credentials: dict = Depends(get_credentials),
+        config: dict = Depends(get_config),
+        guards: tuple = Depends(get_db_guards),
+        admission: None = Depends(  # pylint: disable=unused-argument
+            admit_db_request,
+            scope='function',
+        ),
+):
+    # Routes depend on this with scope='function', so the session is closed,
+    # and the call timed, as soon as the route returns; streamed bodies and
+    # background tasks do not hold the connection or count as database time.
+    breaker, _ = guards
+    started = time.monotonic()
+    if not breaker.allow():
+        raise HTTPException(
+            status_code=503,
+            detail='Database unavailable',
+            headers={'Retry-After': str(math.ceil(breaker.retry_after()) or 1)},
+        )
+
     try:
         connection = conn.connect(**credentials)
-        yield DBSession(connection)
+    except conn.Error as exception:
+        breaker.record_failure(started)
+        raise HTTPException(
+            status_code=503,
+            detail='Database unavailable',
+        ) from exception
+
+    overloaded = False
+    try:
+        session = DBSession(
+            connection,
+            time_ordered_uuids=config.get('time_ordered_uuids', False),
+            single_flight=READS if config.get('coalesce_reads', True) else None,
+        )
+        max_execution_time = config.get('db_limits', {}).get('max_execution_time_ms')
+        if max_execution_time:
+            session.set_max_execution_time(max_execution_time)
+        yield session
+    except conn.Error as exception:
+        overloaded = is_overload_error(exception)
+        raise
     finally:
         connection.close()
+        if overloaded:
+            breaker.record_failure(started)
+        else:
+            breaker.record_success(started)
+
+
+# Asynchronous user deletions run here, apart from any request, with a
+# connection of their own. A single worker queues them, so that they do not
+# compete with requests for connections.
+USER_DELETIONS = ThreadPoolExecutor(max_workers=1, thread_name_prefix='user-deletion')
+
+
+def run_user_deletion_job(credentials: dict, username: str, chunk_size: int = 500):
+    try:
+        connection = conn.connect(**credentials)
+        try:
+            DBSession(connection, single_flight=READS).run_user_deletion(username, chunk_size)
+        finally:
+            connection.close()
+    except Exception:
+        # Nobody waits on the job, so its failure would go unnoticed.
+        logging.getLogger(__name__).exception('Deletion of user %s failed', username)
+        raise
@@ -1,7 +1,18 @@
 # pylint: disable=missing-module-docstring
-from fastapi import FastAPI
+import json
 
-from .routers import task, user
+import mysql.connector as conn
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from utils.utils import get_config_filename
+
+from .compression import CompressionMiddleware
+from .overload import is_overload_error
+from .profiling import ProfilingMiddleware, SamplingProfiler
+from .ratelimit import RateLimitMiddleware
+from .routers import health, metrics, task, user
 
 tags_metadata = [
     {
@@ -11,7 +22,15 @@ tags_metadata = [
     {
         'name': 'user',
         'description': 'Operations related to users.',
-    }
+    },
+    {
+        'name': 'metrics',
+        'description': 'Service metrics.',
+    },
+    {
+        'name': 'health',
+        'description': 'Liveness and readiness probes.',
+    },
 ]
 
 app = FastAPI(
@@ -20,5 +39,64 @@ app = FastAPI(
     openapi_tags=tags_metadata,
 )
 
+
+@app.exception_handler(conn.Error)
+async def handle_database_error(request: Request, exception: conn.Error):
+    # pylint: disable=unused-argument
+    if is_overload_error(exception):
+        return JSONResponse(
+            {'detail': 'Database overloaded'},
+            status_code=503,
+            headers={'Retry-After': '1'},
+        )
+    return JSONResponse({'detail': 'Internal Server Error'}, status_code=500)
+
+
 app.include_router(task.router, prefix='/task', tags=['task'])
 app.include_router(user.router, prefix='/user', tags=['user'])
+app.include_router(metrics.router, prefix='/metrics', tags=['metrics'])
+app.include_router(health.router, prefix='/health', tags=['health'])
+
+
+def add_configured_middleware(asgi_app, config: dict):
+    if 'compression' in config:
+        asgi_app = CompressionMiddleware(asgi_app, **config['compression'])
+
+    if 'rate_limit' in config:
+        asgi_app = RateLimitMiddleware(asgi_app, **config['rate_limit'])
+
+    # Nothing is installed unless profiling is enabled, so that it costs
+    # nothing otherwise; the middleware serves POST /profiling/dump itself.
+    if config.get('profiling', {}).get('enabled'):
+        asgi_app = ProfilingMiddleware(
+            asgi_app,
+            profiler=SamplingProfiler(config['profiling'].get('interval', 0.005)),
+            token=config['profiling']['token'],
+            sample_rate=config['profiling'].get('sample_rate', 0.01),
+            output_file=config['profiling'].get('output_file', 'profile.folded'),
+        )
+
+    return asgi_app
+
+
+class ConfiguredMiddleware:
+    """Adds the middlewares enabled in the config on the first request. The
+    config file comes from the same `get_config_filename` dependency as the
+    routes', so overriding it configures the middlewares as well."""
+
+    def __init__(self, app):  # pylint: disable=redefined-outer-name
+        self.app = app
+        self.configured_app = None
+
+    async def __call__(self, scope, receive, send):
+        if self.configured_app is None:
+            get_filename = scope['app'].dependency_overrides.get(
+                get_config_filename,
+                get_config_filename,
+            )
+            with open(get_filename(), 'r') as file:
+                self.configured_app = add_configured_middleware(self.app, json.load(file))
+        await self.configured_app(scope, receive, send)
+
+
+app.add_middleware(ConfiguredMiddleware)
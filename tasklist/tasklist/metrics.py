@@ -0,0 +1,12 @@
+# pylint: disable=missing-module-docstring, missing-function-docstring
+from typing import Callable, Dict
+
+SOURCES: Dict[str, Callable[[], dict]] = {}
+
+
+def register(name: str, source: Callable[[], dict]):
+    SOURCES[name] = source
+
+
+def collect():
+    return {name: source() for name, source in SOURCES.items()}
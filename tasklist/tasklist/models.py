@@ -1,5 +1,7 @@
 # pylint: disable=missing-module-docstring,missing-class-docstring
-from typing import Optional
+from enum import Enum
+from typing import List, Optional
+from uuid import UUID
 
 from pydantic import BaseModel, Field  # pylint: disable=no-name-in-module
 
@@ -56,3 +58,91 @@ class User(BaseModel):
             }
         }
 
+
+class TaskListFormat(str, Enum):
+    FULL = 'full'
+    COMPACT = 'compact'
+
+
+# pylint: disable=too-few-public-methods
+class TaskChange(BaseModel):
+    uuid: UUID = Field(
+        ...,
+        title='Task UUID',
+    )
+    deleted: bool = Field(
+        False,
+        title='Shows whether the task was deleted',
+    )
+    task: Optional[Task] = Field(
+        None,
+        title='Current task contents, absent for deleted tasks',
+    )
+
+
+# pylint: disable=too-few-public-methods
+class TaskChanges(BaseModel):
+    changes: List[TaskChange] = Field(
+        [],
+        title='Changed tasks, oldest change first',
+    )
+    token: int = Field(
+        0,
+        title='Token to be passed as `since` on the next sync',
+    )
+    has_more: bool = Field(
+        False,
+        title='Shows whether there are more changes after this page',
+    )
+
+
+class UserDeletionStatus(str, Enum):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+
+# pylint: disable=too-few-public-methods
+class UserDeletion(BaseModel):
+    username: str = Field(
+        ...,
+        title='User`s username',
+        max_length=40,
+    )
+    status: UserDeletionStatus = Field(
+        UserDeletionStatus.PENDING,
+        title='Deletion progress',
+    )
+    tasks_total: int = Field(
+        0,
+        title='Tasks owned by the user when the deletion started',
+    )
+    tasks_detached: int = Field(
+        0,
+        title='Tasks already detached from the user',
+    )
+
+
+# pylint: disable=too-few-public-methods
+class UserBulkError(BaseModel):
+    index: int = Field(
+        ...,
+        title='Position of the rejected user in the request',
+    )
+    detail: str = Field(
+        ...,
+        title='Why the user was rejected',
+    )
+
+
+# pylint: disable=too-few-public-methods
+class UserBulkResult(BaseModel):
+    upserted: List[str] = Field(
+        [],
+        title='Usernames created or updated',
+    )
+    errors: List[UserBulkError] = Field(
+        [],
+        title='Users that were rejected',
+    )
@@ -0,0 +1,177 @@
+# pylint: disable=missing-module-docstring, missing-function-docstring, missing-class-docstring
+import asyncio
+import threading
+import time
+
+from collections import deque
+
+import mysql.connector as conn
+
+# Lost connection, lock wait timeout and MAX_EXECUTION_TIME exceeded.
+OVERLOAD_ERRNOS = {1205, 2013, 3024}
+
+
+def is_overload_error(exception: Exception):
+    return (
+        isinstance(exception, (conn.errors.OperationalError, conn.errors.InterfaceError))
+        or getattr(exception, 'errno', None) in OVERLOAD_ERRNOS
+    )
+
+
+class CircuitBreaker:
+    """Fails fast once the database keeps failing or answering slowly, and
+    lets a single probe through after `reset_timeout` seconds.
+
+    Calls report their results with the monotonic time they started at.
+    Results of calls that started before the breaker last opened are
+    ignored, so that only the probe can close it again."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(
+            self,
+            failure_threshold: int = 5,
+            slow_call_seconds: float = 2.0,
+            reset_timeout: float = 10.0,
+    ):
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.failures = 0
+        self.slow_calls = 0
+        self.rejected = 0
+        self.trips = 0
+
+    def allow(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and \
+                    time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            self.rejected += 1
+            return False
+
+    def retry_after(self):
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self, started: float):
+        if time.monotonic() - started > self.slow_call_seconds:
+            with self.lock:
+                self.slow_calls += 1
+            self.record_failure(started)
+            return
+        with self.lock:
+            if self.__counts(started):
+                self.consecutive_failures = 0
+                self.state = self.CLOSED
+
+    def record_failure(self, started: float):
+        with self.lock:
+            self.failures += 1
+            if not self.__counts(started):
+                return
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or \
+                    self.consecutive_failures >= self.failure_threshold:
+                self.trips += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def __counts(self, started: float):
+        return self.state != self.OPEN and started >= self.opened_at
+
+    def metrics(self):
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'slow_calls': self.slow_calls,
+            'rejected': self.rejected,
+            'trips': self.trips,
+        }
+
+
+class AdmissionQueue:
+    """Bounds the database work in flight in a worker. Callers beyond
+    `max_in_flight` wait up to `timeout` seconds, and at most `max_queue` of
+    them may wait at once.
+
+    Callers wait on the event loop, so that waiting takes no threadpool
+    thread away from the admitted requests. Each of those still needs one,
+    so keep `max_in_flight` below the threadpool size (40 by default)."""
+
+    def __init__(self, max_in_flight: int = 32, max_queue: int = 64, timeout: float = 1.0):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        # Futures of the callers waiting for a slot, oldest first.
+        self.waiters = deque()
+        self.in_flight = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    async def acquire(self):
+        with self.lock:
+            if self.in_flight < self.max_in_flight:
+                self.in_flight += 1
+                return True
+            if len(self.waiters) >= self.max_queue:
+                self.rejected += 1
+                return False
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            self.__abandon(waiter)
+            with self.lock:
+                self.timed_out += 1
+            return False
+        except asyncio.CancelledError:
+            self.__abandon(waiter)
+            raise
+        return True
+
+    def release(self):
+        with self.lock:
+            if not self.waiters:
+                self.in_flight -= 1
+                return
+            waiter = self.waiters.popleft()
+        # The slot goes straight to the waiter, which may run on the event
+        # loop of another thread.
+        waiter.get_loop().call_soon_threadsafe(self.__hand_over, waiter)
+
+    def __hand_over(self, waiter):
+        if waiter.done():
+            # Gave up meanwhile, so the slot goes to the next one.
+            self.release()
+        else:
+            waiter.set_result(None)
+
+    def __abandon(self, waiter):
+        with self.lock:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+                return
+        # A slot was handed over already. If it arrived in time after all,
+        # it is given back here; otherwise __hand_over passes it on.
+        if waiter.done() and not waiter.cancelled():
+            self.release()
+
+    def metrics(self):
+        return {
+            'in_flight': self.in_flight,
+            'waiting': len(self.waiters),
+            'rejected': self.rejected,
+            'timed_out': self.timed_out,
+        }
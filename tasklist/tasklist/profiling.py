@@ -0,0 +1,192 @@
+# pylint: disable=missing-module-docstring, missing-function-docstring, missing-class-docstring
+import hmac
+import os.path
+import random
+import sys
+import threading
+import time
+
+from collections import Counter
+from urllib.parse import parse_qs
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse, PlainTextResponse
+
+TOKEN_HEADER = 'X-Profiling-Token'
+
+DUMP_PATH = '/profiling/dump'
+
+# Threads parked in these modules are idle and left out of the samples.
+IDLE_MODULES = ('threading.py', 'selectors.py', 'queue.py')
+
+
+class SamplingProfiler:
+    """Statistical profiler: while at least one collector is registered, a
+    background thread periodically records the stacks of the threads its
+    `threads` function returns as folded stacks (the input format of flame
+    graph tools)."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.lock = threading.Lock()
+        # id(collector) -> (collector, threads)
+        self.collectors = {}
+        self.thread = None
+        self.totals = Counter()
+
+    def start(self, collector: Counter, threads):
+        with self.lock:
+            self.collectors[id(collector)] = (collector, threads)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def stop(self, collector: Counter):
+        with self.lock:
+            del self.collectors[id(collector)]
+
+    def run(self):
+        while True:
+            frames = sys._current_frames()  # pylint: disable=protected-access
+            stacks = {}
+            with self.lock:
+                if not self.collectors:
+                    self.thread = None
+                    return
+                for collector, threads in self.collectors.values():
+                    for thread_id in threads():
+                        if thread_id not in stacks:
+                            stacks[thread_id] = self.sample(frames.get(thread_id))
+                        if stacks[thread_id] is not None:
+                            collector[stacks[thread_id]] += 1
+            time.sleep(self.interval)
+
+    @staticmethod
+    def sample(frame):
+        if frame is None or os.path.basename(frame.f_code.co_filename) in IDLE_MODULES:
+            return None
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(
+                f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+            )
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def dump(self, file_name: str):
+        with self.lock:
+            totals = Counter(self.totals)
+        with open(file_name, 'w') as file:
+            file.write(format_stacks(totals))
+        return {'file': file_name, 'stacks': len(totals), 'samples': sum(totals.values())}
+
+
+def format_stacks(stacks: Counter):
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+
+def is_authorized(token: str, supplied: str):
+    return bool(token) and supplied is not None and hmac.compare_digest(token, supplied)
+
+
+def threadpool_threads():
+    # The worker threads of the anyio threadpool, which run sync endpoints and
+    # dependencies and validate the responses of sync endpoints.
+    return [
+        thread.ident for thread in threading.enumerate()
+        if type(thread).__module__.startswith('anyio.')
+    ]
+
+
+class ProfilingMiddleware:
+    """Profiles a random `sample_rate` share of requests into the profiler
+    totals, which an authorized `POST /profiling/dump` writes to
+    `output_file`. An authorized request with `profile=1` is answered with
+    its own folded stacks instead of its response.
+
+    The event loop and the threadpool are shared by all requests, so a
+    request is only sampled while it is the only one in flight: the profile
+    then covers its validation, dependencies, endpoint and serialisation, but
+    not the time it spends alongside other requests."""
+
+    def __init__(
+            self,
+            app,
+            profiler: SamplingProfiler,
+            token: str,
+            sample_rate: float = 0.01,
+            output_file: str = 'profile.folded',
+    ):
+        self.app = app
+        self.profiler = profiler
+        self.token = token
+        self.sample_rate = sample_rate
+        self.output_file = output_file
+        self.active = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        authorized = is_authorized(self.token, Headers(scope=scope).get(TOKEN_HEADER))
+        if scope['path'] == DUMP_PATH and scope['method'] == 'POST':
+            await self.dump(authorized, scope, receive, send)
+            return
+
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        self.active += 1
+        try:
+            if query.get('profile') == ['1'] and authorized:
+                await self.profile_request(scope, receive, send)
+            elif random.random() < self.sample_rate:
+                await self.run_profiled(self.profiler.totals, scope, receive, send)
+            else:
+                await self.app(scope, receive, send)
+        finally:
+            self.active -= 1
+
+    async def dump(self, authorized: bool, scope, receive, send):
+        if authorized:
+            response = JSONResponse(self.profiler.dump(self.output_file))
+        else:
+            response = JSONResponse({'detail': 'Invalid profiling token'}, status_code=403)
+        await response(scope, receive, send)
+
+    async def run_profiled(self, collector: Counter, scope, receive, send):
+        loop_thread = threading.get_ident()
+
+        def threads():
+            if self.active != 1:
+                return []
+            return [loop_thread, *threadpool_threads()]
+
+        self.profiler.start(collector, threads)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.stop(collector)
+
+    async def profile_request(self, scope, receive, send):
+        stacks = Counter()
+        status = None
+
+        async def discard(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+
+        started = time.perf_counter()
+        await self.run_profiled(stacks, scope, receive, discard)
+        elapsed = time.perf_counter() - started
+
+        response = PlainTextResponse(
+            format_stacks(stacks),
+            headers={
+                'X-Profile-Status': str(status),
+                'X-Profile-Seconds': f'{elapsed:.6f}',
+                'X-Profile-Samples': str(sum(stacks.values())),
+            },
+        )
+        await response(scope, receive, send)
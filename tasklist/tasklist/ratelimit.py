@@ -0,0 +1,137 @@
+# pylint: disable=missing-module-docstring, missing-function-docstring, missing-class-docstring
+import math
+import time
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+from . import metrics
+
+DEFAULT_COSTS = {
+    'GET /task': 10,
+    'DELETE /task': 20,
+    'DELETE /user': 20,
+}
+
+
+class RateLimitBackend(ABC):
+    """Stores token buckets. Implement this to share buckets across
+    processes; acquire() must take the tokens atomically."""
+
+    @abstractmethod
+    async def acquire(self, key: str, cost: float) -> float:
+        """Takes `cost` tokens from the bucket of `key` and returns 0, or
+        returns how many seconds to wait if there are not enough tokens."""
+
+    def metrics(self) -> dict:
+        return {}
+
+
+class InMemoryBackend(RateLimitBackend):
+    def __init__(self, capacity: float, refill_rate: float, max_buckets: int = 10000):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.max_buckets = max_buckets
+        # key -> (tokens, last refill time), least recently used first.
+        self.buckets = OrderedDict()
+        self.evicted = 0
+
+    async def acquire(self, key, cost):
+        now = time.monotonic()
+        tokens, updated = self.buckets.pop(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated) * self.refill_rate)
+        cost = min(cost, self.capacity)
+
+        if tokens < cost:
+            self.buckets[key] = (tokens, now)
+            return (cost - tokens) / self.refill_rate
+
+        self.buckets[key] = (tokens - cost, now)
+        if len(self.buckets) > self.max_buckets:
+            # Evicting a bucket refills it, which the least recently used one
+            # is the closest to anyway.
+            self.buckets.popitem(last=False)
+            self.evicted += 1
+        return 0
+
+    def metrics(self):
+        return {'buckets': len(self.buckets), 'evicted': self.evicted}
+
+
+class RateLimitMiddleware:
+    """Limits requests per client with token buckets. Each route costs a
+    number of tokens, so full listings drain a bucket faster than point
+    reads.
+
+    Clients are told apart by IP address, or by the `key_header` header when
+    set. Only set it behind a proxy that authenticates clients and sets the
+    header itself: a client choosing its own key gets a fresh bucket with
+    every new value."""
+
+    def __init__(
+            self,
+            app,
+            capacity: float = 100,
+            refill_rate: float = 20,
+            costs: dict = None,
+            key_header: str = None,
+            backend: RateLimitBackend = None,
+    ):
+        self.app = app
+        self.costs = {**DEFAULT_COSTS, **(costs or {})}
+        self.key_header = key_header
+        self.backend = backend or InMemoryBackend(capacity, refill_rate)
+        self.allowed = 0
+        self.limited = 0
+        self.limited_by_route = {}
+        metrics.register('rate_limit', self.metrics)
+
+    def get_key(self, scope):
+        if self.key_header is not None:
+            key = Headers(scope=scope).get(self.key_header)
+            if key:
+                return f'{self.key_header}:{key}'
+        client = scope.get('client')
+        return client[0] if client else 'unknown'
+
+    def get_route(self, scope):
+        return f'{scope["method"]} {scope["path"].rstrip("/")}'
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        route = self.get_route(scope)
+        retry_after = await self.backend.acquire(
+            self.get_key(scope),
+            self.costs.get(route, 1),
+        )
+        if retry_after > 0:
+            self.limited += 1
+            # Paths are chosen by the client, so only the priced routes get
+            # their own count; the rest would grow without bound.
+            counted_route = route if route in self.costs else 'other'
+            self.limited_by_route[counted_route] = \
+                self.limited_by_route.get(counted_route, 0) + 1
+            response = JSONResponse(
+                {'detail': 'Too many requests'},
+                status_code=429,
+                headers={'Retry-After': str(math.ceil(retry_after))},
+            )
+            await response(scope, receive, send)
+            return
+
+        self.allowed += 1
+        await self.app(scope, receive, send)
+
+    def metrics(self):
+        return {
+            'allowed': self.allowed,
+            'limited': self.limited,
+            'limited_by_route': dict(self.limited_by_route),
+            **self.backend.metrics(),
+        }
@@ -0,0 +1,37 @@
+# pylint: disable=missing-module-docstring, missing-function-docstring
+import mysql.connector as conn
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from ..database import DBSession, get_credentials
+
+router = APIRouter()
+
+
+@router.get(
+    '/live',
+    summary='Reads liveness',
+    description='Answers as long as the worker is able to serve requests.',
+)
+async def read_liveness():
+    return {'status': 'ok'}
+
+
+@router.get(
+    '/ready',
+    summary='Reads readiness',
+    description='Answers once the worker is able to reach the database.',
+)
+def read_readiness(credentials: dict = Depends(get_credentials)):
+    try:
+        connection = conn.connect(**credentials)
+    except conn.Error as exception:
+        raise HTTPException(
+            status_code=503,
+            detail='Database unavailable',
+        ) from exception
+    try:
+        DBSession(connection).ping()
+    finally:
+        connection.close()
+    return {'status': 'ok'}
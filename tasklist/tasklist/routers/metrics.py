@@ -0,0 +1,18 @@
+# pylint: disable=missing-module-docstring, missing-function-docstring
+from typing import Any, Dict
+
+from fastapi import APIRouter
+
+from .. import metrics
+
+router = APIRouter()
+
+
+@router.get(
+    '',
+    summary='Reads service metrics',
+    description='Reads the counters exposed by the service components.',
+    response_model=Dict[str, Dict[str, Any]],
+)
+async def read_metrics():
+    return metrics.collect()
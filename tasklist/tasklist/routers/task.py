@@ -1,24 +1,83 @@
 # pylint: disable=missing-module-docstring, missing-function-docstring, invalid-name
+import json
 import uuid
 
 from typing import Dict
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
 
-from ..database import DBSession, get_db
-from ..models import Task
+from ..database import TASK_FIELDS, DBSession, get_db
+from ..models import Task, TaskChanges, TaskListFormat
 
 router = APIRouter()
 
 
+def encode_compact_tasks(rows, fields=TASK_FIELDS, chunk_size: int = 500):
+    # Encoded in chunks so that the response can be compressed and sent
+    # while the rest of the list is still being serialised.
+    yield '{"fields": %s, "rows": [' % json.dumps(['uuid', *fields])
+    for start in range(0, len(rows), chunk_size):
+        chunk = ','.join(
+            json.dumps([str(uuid_), *values])
+            for uuid_, *values in rows[start:start + chunk_size]
+        )
+        yield chunk if start == 0 else ',' + chunk
+    yield ']}'
+
+
+def parse_field_list(value: str, parameter: str, allowed, descending: bool = False):
+    names = tuple(dict.fromkeys(
+        name.strip() for name in value.split(',') if name.strip()
+    ))
+    invalid = [
+        name for name in names
+        if (name[1:] if descending and name.startswith('-') else name) not in allowed
+    ]
+    if invalid or not names:
+        raise HTTPException(
+            status_code=422,
+            detail=f'Invalid {parameter}: {", ".join(invalid) or value!r}',
+        )
+    return names
+
+
 @router.get(
     '',
     summary='Reads task list',
-    description='Reads the whole task list.',
+    description=(
+        'Reads the whole task list. Archived tasks are only listed with '
+        '`include_archived`. `fields` limits the fields returned, e.g. '
+        '`completed,user`, and `sort` orders the tasks by the given fields, '
+        'descending when prefixed with `-`, e.g. `user,-completed`. With '
+        '`format=compact` tasks are returned as rows under a single list of '
+        'field names.'
+    ),
     response_model=Dict[uuid.UUID, Task],
+    response_model_exclude_unset=True,
 )
-async def read_tasks(completed: bool = None, db: DBSession = Depends(get_db)):
-    return db.read_tasks(completed)
+def read_tasks(
+        completed: bool = None,
+        include_archived: bool = False,
+        fields: str = None,
+        sort: str = None,
+        list_format: TaskListFormat = Query(TaskListFormat.FULL, alias='format'),
+        db: DBSession = Depends(get_db, scope='function'),
+):
+    fields = TASK_FIELDS if fields is None else \
+        parse_field_list(fields, 'fields', TASK_FIELDS)
+    sort = () if sort is None else \
+        parse_field_list(sort, 'sort', ('uuid', ) + TASK_FIELDS, descending=True)
+
+    if list_format == TaskListFormat.COMPACT:
+        return StreamingResponse(
+            encode_compact_tasks(
+                db.read_task_rows(completed, include_archived, fields, sort),
+                fields,
+            ),
+            media_type='application/json',
+        )
+    return db.read_tasks(completed, include_archived, fields, sort)
 
 
 @router.post(
@@ -27,17 +86,37 @@ async def read_tasks(completed: bool = None, db: DBSession = Depends(get_db)):
     description='Creates a new task and returns its UUID.',
     response_model=uuid.UUID,
 )
-async def create_task(item: Task, db: DBSession = Depends(get_db)):
+def create_task(item: Task, db: DBSession = Depends(get_db, scope='function')):
     return db.create_task(item)
 
 
+@router.get(
+    '/changes',
+    summary='Reads task changes',
+    description='Reads tasks created, altered or deleted since a sync token.',
+    response_model=TaskChanges,
+)
+def read_task_changes(
+        since: int = Query(0, ge=0),
+        limit: int = Query(100, ge=1, le=1000),
+        db: DBSession = Depends(get_db, scope='function'),
+):
+    try:
+        return db.read_task_changes(since, limit)
+    except ValueError as exception:
+        raise HTTPException(
+            status_code=410,
+            detail='Sync token expired, a full sync is required',
+        ) from exception
+
+
 @router.get(
     '/{uuid_}',
     summary='Reads task',
     description='Reads task from UUID.',
     response_model=Task,
 )
-async def read_task(uuid_: uuid.UUID, db: DBSession = Depends(get_db)):
+def read_task(uuid_: uuid.UUID, db: DBSession = Depends(get_db, scope='function')):
     try:
         return db.read_task(uuid_)
     except KeyError as exception:
@@ -52,10 +131,10 @@ async def read_task(uuid_: uuid.UUID, db: DBSession = Depends(get_db)):
     summary='Replaces a task',
     description='Replaces a task identified by its UUID.',
 )
-async def replace_task(
+def replace_task(
         uuid_: uuid.UUID,
         item: Task,
-        db: DBSession = Depends(get_db),
+        db: DBSession = Depends(get_db, scope='function'),
 ):
     try:
         db.replace_task(uuid_, item)
@@ -71,10 +150,10 @@ async def replace_task(
     summary='Alters task',
     description='Alters a task identified by its UUID',
 )
-async def alter_task(
+def alter_task(
         uuid_: uuid.UUID,
         item: Task,
-        db: DBSession = Depends(get_db),
+        db: DBSession = Depends(get_db, scope='function'),
 ):
     try:
         old_item = db.read_task(uuid_)
@@ -93,7 +172,7 @@ async def alter_task(
     summary='Deletes task',
     description='Deletes a task identified by its UUID',
 )
-async def remove_task(uuid_: uuid.UUID, db: DBSession = Depends(get_db)):
+def remove_task(uuid_: uuid.UUID, db: DBSession = Depends(get_db, scope='function')):
     try:
         db.remove_task(uuid_)
     except KeyError as exception:
@@ -108,5 +187,5 @@ async def remove_task(uuid_: uuid.UUID, db: DBSession = Depends(get_db)):
     summary='Deletes all tasks, use with caution',
     description='Deletes all tasks, use with caution',
 )
-async def remove_all_tasks(db: DBSession = Depends(get_db)):
+def remove_all_tasks(db: DBSession = Depends(get_db, scope='function')):
     db.remove_all_tasks()
@@ -1,11 +1,12 @@
 import uuid
 
-from typing import Dict
+from typing import Any, Dict, List, Optional
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from pydantic import ValidationError  # pylint: disable=no-name-in-module
 
-from ..database import DBSession, get_db
-from ..models import User
+from ..database import USER_DELETIONS, DBSession, get_credentials, get_db, run_user_deletion_job
+from ..models import User, UserBulkError, UserBulkResult, UserDeletion
 
 router = APIRouter()
 
@@ -15,7 +16,7 @@ router = APIRouter()
     description='Reads User from username.',
     response_model=User,
 )
-async def read_user(username: str, db: DBSession = Depends(get_db)):
+def read_user(username: str, db: DBSession = Depends(get_db, scope='function')):
     try:
         return db.read_user(username)
     except KeyError as exception:
@@ -30,18 +31,50 @@ async def read_user(username: str, db: DBSession = Depends(get_db)):
     description='Creates a new user and returns its username.',
     response_model=str,
 )
-async def create_user(user: User, db: DBSession = Depends(get_db)):
+def create_user(user: User, db: DBSession = Depends(get_db, scope='function')):
     return db.create_user(user)
 
+@router.post(
+    '/bulk',
+    summary='Creates or updates many users',
+    description=(
+        'Creates the given users. Users that already exist only have the '
+        'names given for them updated. Invalid users are reported by position and do not prevent '
+        'the others from being saved.'
+    ),
+    response_model=UserBulkResult,
+)
+def create_users(users: List[Dict[str, Any]], db: DBSession = Depends(get_db, scope='function')):
+    valid_users = []
+    errors = []
+    for index, data in enumerate(users):
+        try:
+            user = User(**data)
+        except ValidationError as exception:
+            errors.append(UserBulkError(
+                index=index,
+                detail='; '.join(
+                    '.'.join(str(loc) for loc in error['loc']) + ': ' + error['msg']
+                    for error in exception.errors()
+                ),
+            ))
+            continue
+        if not user.username:
+            errors.append(UserBulkError(index=index, detail='username: field required'))
+            continue
+        valid_users.append(user)
+
+    return UserBulkResult(upserted=db.upsert_users(valid_users), errors=errors)
+
 @router.put(
     '/{username}',
     summary='Replaces a user',
     description='Replaces a user identified by its username.',
 )
-async def replace_user(
+def replace_user(
         username: str,
         user: User,
-        db: DBSession = Depends(get_db),
+        db: DBSession = Depends(get_db, scope='function'),
 ):
     try:
         db.replace_user(username, user)
@@ -56,10 +89,10 @@ async def replace_user(
     summary='Alters user',
     description='Alters a user identified by its username',
 )
-async def alter_user(
+def alter_user(
         username: str,
         item: User,
-        db: DBSession = Depends(get_db),
+        db: DBSession = Depends(get_db, scope='function'),
 ):
     try:
         old_item = db.read_user(username)
@@ -75,16 +108,55 @@ async def alter_user(
 @router.delete(
     '/{username}',
     summary='Deletes user',
-    description='Deletes a user identified by its username',
+    description=(
+        'Deletes a user identified by its username. With `async` the user\'s '
+        'tasks are detached in the background, in small chunks, and the '
+        'deletion progress is returned. Fails with 409 while an earlier '
+        'deletion of the user is unfinished.'
+    ),
+    response_model=Optional[UserDeletion],
 )
-async def remove_user(username: str, db: DBSession = Depends(get_db)):
+def remove_user(
+        username: str,
+        response: Response,
+        run_async: bool = Query(False, alias='async'),
+        db: DBSession = Depends(get_db, scope='function'),
+        credentials: dict = Depends(get_credentials),
+):
     try:
-        db.remove_user(username)
+        if not run_async:
+            db.remove_user(username)
+            return None
+        deletion = db.start_user_deletion(username)
     except KeyError as exception:
         raise HTTPException(
             status_code=404,
             detail='User not found',
         ) from exception
+    except ValueError as exception:
+        raise HTTPException(
+            status_code=409,
+            detail='User deletion already in progress',
+        ) from exception
+
+    USER_DELETIONS.submit(run_user_deletion_job, credentials, username)
+    response.status_code = 202
+    return deletion
+
+@router.get(
+    '/{username}/deletion',
+    summary='Reads user deletion progress',
+    description='Reads the progress of an asynchronous user deletion.',
+    response_model=UserDeletion,
+)
+def read_user_deletion(username: str, db: DBSession = Depends(get_db, scope='function')):
+    try:
+        return db.read_user_deletion(username)
+    except KeyError as exception:
+        raise HTTPException(
+            status_code=404,
+            detail='User deletion not found',
+        ) from exception
 
 
 @router.delete(
@@ -92,5 +164,5 @@ async def remove_user(username: str, db: DBSession = Depends(get_db)):
     summary='Deletes all users, use with caution',
     description='Deletes all users, use with caution',
 )
-async def remove_all_users(db: DBSession = Depends(get_db)):
+def remove_all_users(db: DBSession = Depends(get_db, scope='function')):
     db.remove_all_users()
\ No newline at end of file
@@ -0,0 +1,114 @@
+# pylint: disable=missing-module-docstring, missing-function-docstring, redefined-outer-name
+import json
+import os
+
+import pytest
+
+from fastapi import Depends
+
+from utils import utils
+
+from tasklist import database
+from tasklist.main import app
+from tasklist.routers import user as user_router
+
+from memory_db import InMemoryDatabase, InMemoryDBSession
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        '--in-memory',
+        action='store_true',
+        help='Run the API tests against an in-memory database instead of MySQL',
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'mysql: test needs a real MySQL database')
+
+
+def pytest_collection_modifyitems(config, items):
+    if not config.getoption('--in-memory'):
+        return
+    skip = pytest.mark.skip(reason='needs a real MySQL database')
+    for item in items:
+        if 'mysql' in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope='session')
+def backend(request, tmp_path_factory):
+    """Yields a function that returns a session for direct database access.
+
+    With MySQL each pytest-xdist worker gets its own database, cloned from a
+    template that is migrated once for all of them."""
+    if request.config.getoption('--in-memory'):
+        memory = InMemoryDatabase()
+
+        def get_memory_db(
+                config: dict = Depends(database.get_config),
+                admission: None = Depends(  # pylint: disable=unused-argument
+                    database.admit_db_request,
+                    scope='function',
+                ),
+        ):
+            yield InMemoryDBSession(
+                memory,
+                time_ordered_uuids=config.get('time_ordered_uuids', False),
+            )
+
+        def run_memory_user_deletion_job(credentials, username, chunk_size=500):
+            # pylint: disable=unused-argument
+            InMemoryDBSession(memory).run_user_deletion(username, chunk_size)
+
+        app.dependency_overrides[utils.get_config_filename] = \
+            utils.get_config_test_filename
+        app.dependency_overrides[database.get_db] = get_memory_db
+        app.dependency_overrides[database.get_credentials] = lambda: {}
+        original_job = user_router.run_user_deletion_job
+        user_router.run_user_deletion_job = run_memory_user_deletion_job
+        yield memory.reset, lambda: InMemoryDBSession(memory)
+        user_router.run_user_deletion_job = original_job
+        del app.dependency_overrides[database.get_db]
+        del app.dependency_overrides[database.get_credentials]
+        return
+
+    template_config = utils.get_config_test_filename()
+    admin_secrets = utils.get_admin_secrets_filename()
+    with open(template_config, 'r') as file:
+        config = json.load(file)
+    template = config['database']
+    worker = os.environ.get('PYTEST_XDIST_WORKER', 'main')
+    config['database'] = f'{template}_{worker}'
+    worker_config = str(tmp_path_factory.mktemp('config') / 'config.json')
+    with open(worker_config, 'w') as file:
+        json.dump(config, file)
+
+    utils.prepare_template_database(utils.get_migrations_dir(), template_config, admin_secrets)
+    utils.clone_database(config['database'], template_config, admin_secrets)
+    app.dependency_overrides[utils.get_config_filename] = lambda: worker_config
+
+    def reset():
+        utils.reset_database(template, worker_config, admin_secrets)
+
+    def admin_session():
+        return database.DBSession(utils.connect(worker_config, admin_secrets))
+
+    yield reset, admin_session
+    utils.drop_database(config['database'], template_config, admin_secrets)
+
+
+@pytest.fixture
+def clean_database(backend):
+    reset, _ = backend
+    reset()
+
+
+@pytest.fixture
+def admin_db(backend):
+    _, admin_session = backend
+    session = admin_session()
+    yield session
+    connection = getattr(session, 'connection', None)
+    if connection is not None:
+        connection.close()
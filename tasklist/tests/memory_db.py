@@ -0,0 +1,317 @@
+# pylint: disable=missing-module-docstring, missing-function-docstring, missing-class-docstring
+import threading
+import time
+import uuid
+
+import mysql.connector as conn
+
+from tasklist.database import TASK_FIELDS, uuid7
+from tasklist.models import Task, TaskChange, TaskChanges, User, UserDeletion
+
+DAY = 24 * 60 * 60
+
+
+class InMemoryDatabase:
+    """Holds the tables of an in-memory test database, shared by all the
+    sessions of a test run."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        self.tasks = {}
+        self.tasks_archive = {}
+        # uuid -> (seq, deleted, changed_at); only the latest change is kept.
+        self.task_changes = {}
+        self.next_seq = 1
+        self.horizon = 0
+        self.users = {}
+        self.user_deletions = {}
+
+
+class InMemoryDBSession:
+    """Stand-in for `tasklist.database.DBSession` used by the tests when
+    running with --in-memory. Mirrors its behaviour, not its SQL."""
+
+    def __init__(self, database: InMemoryDatabase, time_ordered_uuids: bool = False):
+        self.database = database
+        self.new_uuid = uuid7 if time_ordered_uuids else uuid.uuid4
+
+    def set_max_execution_time(self, milliseconds: int):
+        pass
+
+    def ping(self):
+        pass
+
+    def read_task_rows(
+            self,
+            completed: bool = None,
+            include_archived: bool = False,
+            fields=TASK_FIELDS,
+            sort=(),
+    ):
+        with self.database.lock:
+            rows = [
+                (uuid_, *fields_[:3])
+                for uuid_, fields_ in sorted(self.database.tasks.items())
+                if completed is None or fields_[1] == completed
+            ]
+            if include_archived and completed is not False:
+                rows += [
+                    (uuid_, *fields_[:3])
+                    for uuid_, fields_ in sorted(self.database.tasks_archive.items())
+                ]
+
+        # Sorts by the last key first, relying on sort stability; NULLs go
+        # first in ascending order, as in MySQL.
+        columns = ('uuid', ) + TASK_FIELDS
+        for key in reversed(sort):
+            index = columns.index(key.lstrip('-'))
+            rows.sort(
+                key=lambda row, index=index: (row[index] is not None, row[index]),
+                reverse=key.startswith('-'),
+            )
+
+        indexes = [columns.index(field) for field in fields]
+        return [
+            (uuid.UUID(bytes=row[0]), *(row[index] for index in indexes))
+            for row in rows
+        ]
+
+    def read_tasks(
+            self,
+            completed: bool = None,
+            include_archived: bool = False,
+            fields=TASK_FIELDS,
+            sort=(),
+    ):
+        return {
+            uuid_: Task(**dict(zip(fields, values)))
+            for uuid_, *values
+            in self.read_task_rows(completed, include_archived, fields, sort)
+        }
+
+    def create_task(self, item: Task):
+        uuid_ = self.new_uuid()
+        with self.database.lock:
+            self.__check_user(item.user)
+            self.database.tasks[uuid_.bytes] = (
+                item.description, bool(item.completed), item.user, time.time(),
+            )
+            self.__log_task_change(uuid_.bytes)
+        return uuid_
+
+    def read_task(self, uuid_: uuid.UUID):
+        with self.database.lock:
+            for table in (self.database.tasks, self.database.tasks_archive):
+                if uuid_.bytes in table:
+                    description, completed, user = table[uuid_.bytes][:3]
+                    return Task(description=description, completed=completed, user=user)
+        raise KeyError()
+
+    def replace_task(self, uuid_, item):
+        with self.database.lock:
+            if uuid_.bytes not in self.database.tasks:
+                if uuid_.bytes not in self.database.tasks_archive:
+                    raise KeyError()
+                self.database.tasks[uuid_.bytes] = \
+                    self.database.tasks_archive.pop(uuid_.bytes)[:4]
+            self.__check_user(item.user)
+            self.database.tasks[uuid_.bytes] = (
+                item.description, bool(item.completed), item.user, time.time(),
+            )
+            self.__log_task_change(uuid_.bytes)
+
+    def remove_task(self, uuid_):
+        with self.database.lock:
+            for table in (self.database.tasks, self.database.tasks_archive):
+                if table.pop(uuid_.bytes, None) is not None:
+                    self.__log_task_change(uuid_.bytes, deleted=True)
+                    return
+        raise KeyError()
+
+    def remove_all_tasks(self):
+        with self.database.lock:
+            for table in (self.database.tasks, self.database.tasks_archive):
+                for uuid_ in list(table):
+                    self.__log_task_change(uuid_, deleted=True)
+                table.clear()
+
+    def archive_completed_tasks(self, max_age_days: int, batch_size: int = 500):
+        with self.database.lock:
+            threshold = time.time() - max_age_days * DAY
+            uuids = sorted(
+                (
+                    uuid_ for uuid_, (_, completed, _, updated_at)
+                    in self.database.tasks.items()
+                    if completed and updated_at < threshold
+                ),
+                key=lambda uuid_: self.database.tasks[uuid_][3],
+            )[:batch_size]
+            for uuid_ in uuids:
+                self.database.tasks_archive[uuid_] = (
+                    *self.database.tasks.pop(uuid_), time.time(),
+                )
+        return len(uuids)
+
+    def read_task_changes(self, since: int = 0, limit: int = 100):
+        with self.database.lock:
+            if 0 < since < self.database.horizon:
+                raise ValueError()
+            changes = sorted(
+                (seq, uuid_, deleted)
+                for uuid_, (seq, deleted, _) in self.database.task_changes.items()
+                if seq > since
+            )
+            has_more = len(changes) > limit
+            changes = changes[:limit]
+            result = []
+            for _, uuid_, deleted in changes:
+                fields = self.database.tasks.get(uuid_) or \
+                    self.database.tasks_archive.get(uuid_)
+                result.append(TaskChange(
+                    uuid=uuid.UUID(bytes=uuid_),
+                    deleted=deleted,
+                    task=None if deleted else Task(
+                        description=fields[0],
+                        completed=fields[1],
+                        user=fields[2],
+                    ),
+                ))
+        token = changes[-1][0] if changes else since
+        return TaskChanges(changes=result, token=token, has_more=has_more)
+
+    def compact_task_changes(self, max_age_days: int):
+        with self.database.lock:
+            threshold = time.time() - max_age_days * DAY
+            horizon = max(
+                (
+                    seq for seq, deleted, changed_at
+                    in self.database.task_changes.values()
+                    if deleted and changed_at < threshold
+                ),
+                default=None,
+            )
+            if horizon is None:
+                return 0
+            removed = [
+                uuid_ for uuid_, (seq, deleted, _) in self.database.task_changes.items()
+                if deleted and seq <= horizon
+            ]
+            for uuid_ in removed:
+                del self.database.task_changes[uuid_]
+            self.database.horizon = max(self.database.horizon, horizon)
+        return len(removed)
+
+    def read_user(self, username: str):
+        with self.database.lock:
+            if username not in self.database.users:
+                raise KeyError()
+            first_name, last_name = self.database.users[username]
+        return User(first_name=first_name, last_name=last_name, username=username)
+
+    def create_user(self, user: User):
+        with self.database.lock:
+            if user.username in self.database.users:
+                raise conn.errors.IntegrityError(msg='Duplicate entry', errno=1062)
+            self.database.users[user.username] = (user.first_name, user.last_name)
+        return user.username
+
+    def upsert_users(self, users, batch_size: int = 1000):
+        with self.database.lock:
+            for user in users:
+                sent = user.dict(exclude_unset=True)
+                first_name, last_name = self.database.users.get(
+                    user.username,
+                    (user.first_name, user.last_name),
+                )
+                self.database.users[user.username] = (
+                    sent.get('first_name', first_name),
+                    sent.get('last_name', last_name),
+                )
+        return [user.username for user in users]
+
+    def users_exist(self, usernames, batch_size: int = 1000):
+        with self.database.lock:
+            return set(usernames) & set(self.database.users)
+
+    def replace_user(self, username: str, user: User):
+        with self.database.lock:
+            if username not in self.database.users:
+                raise KeyError()
+            self.database.users[username] = (user.first_name, user.last_name)
+
+    def remove_user(self, username: str):
+        with self.database.lock:
+            if username not in self.database.users:
+                raise KeyError()
+            self.__detach_tasks(username)
+            del self.database.users[username]
+
+    def start_user_deletion(self, username: str):
+        with self.database.lock:
+            if username not in self.database.users:
+                raise KeyError()
+            deletion = self.database.user_deletions.get(username)
+            if deletion is not None and deletion[0] in ('pending', 'running'):
+                raise ValueError()
+            tasks_total = sum(
+                fields[2] == username
+                for table in (self.database.tasks, self.database.tasks_archive)
+                for fields in table.values()
+            )
+            self.database.user_deletions[username] = ['pending', tasks_total, 0]
+        return UserDeletion(username=username, tasks_total=tasks_total)
+
+    def read_user_deletion(self, username: str):
+        with self.database.lock:
+            if username not in self.database.user_deletions:
+                raise KeyError()
+            status, tasks_total, tasks_detached = self.database.user_deletions[username]
+        return UserDeletion(
+            username=username,
+            status=status,
+            tasks_total=tasks_total,
+            tasks_detached=tasks_detached,
+        )
+
+    def read_unfinished_user_deletions(self):
+        with self.database.lock:
+            return [
+                username for username, (status, _, _)
+                in self.database.user_deletions.items()
+                if status != 'done'
+            ]
+
+    def run_user_deletion(self, username: str, chunk_size: int = 500):
+        with self.database.lock:
+            deletion = self.database.user_deletions[username]
+            deletion[0] = 'running'
+            deletion[2] += self.__detach_tasks(username)
+            self.database.users.pop(username, None)
+            deletion[0] = 'done'
+
+    def remove_all_users(self):
+        with self.database.lock:
+            for username in list(self.database.users):
+                self.__detach_tasks(username)
+            self.database.users.clear()
+
+    def __check_user(self, username):
+        if username is not None and username not in self.database.users:
+            raise conn.errors.IntegrityError(msg='Cannot add or update a child row', errno=1452)
+
+    def __detach_tasks(self, username):
+        detached = 0
+        for table in (self.database.tasks, self.database.tasks_archive):
+            for uuid_, fields in table.items():
+                if fields[2] == username:
+                    table[uuid_] = (*fields[:2], None, *fields[3:])
+                    self.__log_task_change(uuid_)
+                    detached += 1
+        return detached
+
+    def __log_task_change(self, uuid_: bytes, deleted: bool = False):
+        self.database.task_changes[uuid_] = (self.database.next_seq, deleted, time.time())
+        self.database.next_seq += 1
@@ -1,31 +1,33 @@
 # pylint: disable=missing-module-docstring,missing-function-docstring
-import os.path
+import asyncio
+import json
+import threading
+import time
+import uuid
 
+import mysql.connector as conn
+import pytest
+
+from fastapi import BackgroundTasks, Depends, FastAPI
+from fastapi.responses import StreamingResponse
 from fastapi.testclient import TestClient
 
 from utils import utils
 
-from tasklist.main import app
+from tasklist import metrics
+from tasklist.database import DBSession, get_config, get_db, get_db_guards, uuid7
+from tasklist.main import ConfiguredMiddleware, app
+from tasklist.overload import AdmissionQueue, CircuitBreaker
+from tasklist.profiling import ProfilingMiddleware, SamplingProfiler
+from tasklist.ratelimit import InMemoryBackend, RateLimitBackend, RateLimitMiddleware
 
-client = TestClient(app)
+# Each test starts from an empty database.
+pytestmark = pytest.mark.usefixtures('clean_database')
 
-app.dependency_overrides[utils.get_config_filename] = \
-    utils.get_config_test_filename
+client = TestClient(app)
 
 
-def setup_database():
-    scripts_dir = os.path.join(
-        os.path.dirname(__file__),
-        '..',
-        'database',
-        'migrations',
-    )
-    config_file_name = utils.get_config_test_filename()
-    secrets_file_name = utils.get_admin_secrets_filename()
-    utils.run_all_scripts(scripts_dir, config_file_name, secrets_file_name)
-
 def test_read_main_returns_not_found():
-    setup_database()
     response = client.get('/')
     assert response.status_code == 404
     assert response.json() == {'detail': 'Not Found'}
@@ -33,14 +35,12 @@ def test_read_main_returns_not_found():
 ## --------- TASKS --------- ##
 
 def test_read_tasks_with_no_task():
-    setup_database()
     response = client.get('/task')
     assert response.status_code == 200
     assert response.json() == {}
 
 
 def test_create_and_read_some_tasks():
-    setup_database()
     tasks = [
         {
             "description": "foo",
@@ -122,9 +122,178 @@ def test_create_and_read_some_tasks():
     assert response.json() == {}
 
 
-def test_substitute_task():
-    setup_database()
+def test_read_tasks_compact_and_compressed():
+    # Create enough tasks to go over the compression threshold.
+    task = {'description': 'foo' * 100, 'completed': False, 'user': None}
+    uuids = []
+    for _ in range(10):
+        response = client.post('/task', json=task)
+        assert response.status_code == 200
+        uuids.append(response.json())
+
+    # Read the task list in compact format.
+    response = client.get(
+        '/task?format=compact',
+        headers={'Accept-Encoding': 'gzip'},
+    )
+    assert response.status_code == 200
+    assert response.headers['content-encoding'] == 'gzip'
+    compact = response.json()
+    assert compact['fields'] == ['uuid', 'description', 'completed', 'user']
+    assert sorted(compact['rows']) == sorted(
+        [uuid_, task['description'], task['completed'], task['user']]
+        for uuid_ in uuids
+    )
 
+
+def test_create_tasks_with_time_ordered_uuids():
+    with open(utils.get_config_test_filename(), 'r') as file:
+        config = json.load(file)
+    app.dependency_overrides[get_config] = \
+        lambda: {**config, 'time_ordered_uuids': True}
+    try:
+        uuids = []
+        for _ in range(3):
+            response = client.post('/task', json={'description': 'foo'})
+            assert response.status_code == 200
+            uuids.append(response.json())
+    finally:
+        del app.dependency_overrides[get_config]
+
+    assert all(uuid.UUID(uuid_).version == 7 for uuid_ in uuids)
+    assert sorted(uuids) == uuids
+
+    # Check whether the tasks can be read back through their UUIDs.
+    for uuid_ in uuids:
+        response = client.get(f'/task/{uuid_}')
+        assert response.status_code == 200
+
+
+def test_time_ordered_uuids_increase_within_a_millisecond():
+    # Far more UUIDs than milliseconds go by while they are generated.
+    uuids = [uuid7() for _ in range(10000)]
+    assert sorted(uuids) == uuids
+    assert len(set(uuids)) == len(uuids)
+    assert all(uuid_.version == 7 for uuid_ in uuids)
+
+
+def test_archive_completed_tasks(admin_db):
+    # Create a completed and a pending task.
+    done = {'description': 'foo', 'completed': True, 'user': None}
+    response = client.post('/task', json=done)
+    assert response.status_code == 200
+    uuid_done = response.json()
+    pending = {'description': 'bar', 'completed': False, 'user': None}
+    response = client.post('/task', json=pending)
+    assert response.status_code == 200
+    uuid_pending = response.json()
+
+    # Archive every completed task, however recent.
+    assert admin_db.archive_completed_tasks(-1) == 1
+
+    # Check whether the archived task is only listed on request.
+    response = client.get('/task')
+    assert response.status_code == 200
+    assert response.json() == {uuid_pending: pending}
+    response = client.get('/task?include_archived=true')
+    assert response.status_code == 200
+    assert response.json() == {uuid_pending: pending, uuid_done: done}
+
+    # Check whether the archived task can still be read and altered.
+    response = client.get(f'/task/{uuid_done}')
+    assert response.status_code == 200
+    assert response.json() == done
+    response = client.patch(f'/task/{uuid_done}', json={'completed': False})
+    assert response.status_code == 200
+    response = client.get('/task')
+    assert response.status_code == 200
+    assert response.json() == {
+        uuid_pending: pending,
+        uuid_done: {**done, 'completed': False},
+    }
+
+
+def test_read_tasks_sorted_with_some_fields():
+    users = ['jane_doe', 'john_doe']
+    for username in users:
+        response = client.post('/user', json={'username': username})
+        assert response.status_code == 200
+
+    tasks = [
+        {'description': 'foo', 'completed': False, 'user': 'john_doe'},
+        {'description': 'bar', 'completed': True, 'user': 'jane_doe'},
+        {'description': 'baz', 'completed': True, 'user': 'john_doe'},
+        {'description': 'qux', 'completed': False, 'user': 'jane_doe'},
+    ]
+    uuids = []
+    for task in tasks:
+        response = client.post('/task', json=task)
+        assert response.status_code == 200
+        uuids.append(response.json())
+
+    # Read only some fields, sorted by user and then by completion.
+    response = client.get('/task?fields=completed,user&sort=user,-completed')
+    assert response.status_code == 200
+    assert list(response.json().items()) == [
+        (uuids[1], {'completed': True, 'user': 'jane_doe'}),
+        (uuids[3], {'completed': False, 'user': 'jane_doe'}),
+        (uuids[2], {'completed': True, 'user': 'john_doe'}),
+        (uuids[0], {'completed': False, 'user': 'john_doe'}),
+    ]
+
+    # The compact format lists only the requested fields.
+    response = client.get('/task?format=compact&fields=description&sort=-description')
+    assert response.status_code == 200
+    assert response.json() == {
+        'fields': ['uuid', 'description'],
+        'rows': [
+            [uuids[3], 'qux'],
+            [uuids[0], 'foo'],
+            [uuids[2], 'baz'],
+            [uuids[1], 'bar'],
+        ],
+    }
+
+    # Unknown fields are rejected.
+    response = client.get('/task?fields=password')
+    assert response.status_code == 422
+    response = client.get('/task?sort=-password')
+    assert response.status_code == 422
+
+
+def test_read_archived_tasks_sorted_by_other_fields(admin_db):
+    users = ['jane_doe', 'john_doe']
+    for username in users:
+        response = client.post('/user', json={'username': username})
+        assert response.status_code == 200
+
+    # Archive a completed task of each user.
+    uuids = []
+    for username in users:
+        response = client.post('/task', json={'completed': True, 'user': username})
+        assert response.status_code == 200
+        uuids.append(response.json())
+    assert admin_db.archive_completed_tasks(-1) == 2
+    response = client.post('/task', json={'completed': False, 'user': 'jane_doe'})
+    assert response.status_code == 200
+    uuids.insert(1, response.json())
+
+    # Sort by a field that is not returned.
+    response = client.get('/task?include_archived=true&fields=completed&sort=user,-completed')
+    assert response.status_code == 200
+    assert list(response.json().items()) == [
+        (uuids[0], {'completed': True}),
+        (uuids[1], {'completed': False}),
+        (uuids[2], {'completed': True}),
+    ]
+
+    response = client.get('/task?include_archived=true&format=compact&fields=completed&sort=-user')
+    assert response.status_code == 200
+    assert response.json()['fields'] == ['uuid', 'completed']
+    assert [row[0] for row in response.json()['rows']][0] == uuids[2]
+
+
+def test_substitute_task():
     # Create a task.
     task = {'description': 'foo', 'completed': False, 'user': None}
     response = client.post('/task', json=task)
@@ -147,8 +316,6 @@ def test_substitute_task():
 
 
 def test_alter_task():
-    setup_database()
-
     # Create a task.
     task = {'description': 'foo', 'completed': False, 'user': None}
     response = client.post('/task', json=task)
@@ -171,36 +338,26 @@ def test_alter_task():
 
 
 def test_read_invalid_task():
-    setup_database()
-
     response = client.get('/task/invalid_uuid')
     assert response.status_code == 422
 
 
 def test_read_nonexistant_task():
-    setup_database()
-
     response = client.get('/task/3668e9c9-df18-4ce2-9bb2-82f907cf110c')
     assert response.status_code == 404
 
 
 def test_delete_invalid_task():
-    setup_database()
-
     response = client.delete('/task/invalid_uuid')
     assert response.status_code == 422
 
 
 def test_delete_nonexistant_task():
-    setup_database()
-
     response = client.delete('/task/3668e9c9-df18-4ce2-9bb2-82f907cf110c')
     assert response.status_code == 404
 
 
 def test_delete_all_tasks():
-    setup_database()
-
     # Create a task.
     task = {'description': 'foo', 'completed': False, 'user': None}
     response = client.post('/task', json=task)
@@ -221,11 +378,83 @@ def test_delete_all_tasks():
     assert response.status_code == 200
     assert response.json() == {}
 
+def test_read_task_changes():
+    # Create two tasks.
+    task = {'description': 'foo', 'completed': False, 'user': None}
+    response = client.post('/task', json=task)
+    assert response.status_code == 200
+    uuid_foo = response.json()
+    response = client.post('/task', json={**task, 'description': 'bar'})
+    assert response.status_code == 200
+    uuid_bar = response.json()
+
+    # Read the first page of changes.
+    response = client.get('/task/changes?limit=1')
+    assert response.status_code == 200
+    page = response.json()
+    assert page['has_more']
+    assert page['changes'] == [
+        {'uuid': uuid_foo, 'deleted': False, 'task': task},
+    ]
+
+    # Read the remaining changes from the returned token.
+    response = client.get(f'/task/changes?since={page["token"]}')
+    assert response.status_code == 200
+    page = response.json()
+    assert not page['has_more']
+    assert [change['uuid'] for change in page['changes']] == [uuid_bar]
+
+    # Alter one task and delete the other one.
+    token = page['token']
+    response = client.patch(f'/task/{uuid_foo}', json={'completed': True})
+    assert response.status_code == 200
+    response = client.delete(f'/task/{uuid_bar}')
+    assert response.status_code == 200
+
+    # Check whether only those changes are returned.
+    response = client.get(f'/task/changes?since={token}')
+    assert response.status_code == 200
+    assert response.json()['changes'] == [
+        {'uuid': uuid_foo, 'deleted': False, 'task': {**task, 'completed': True}},
+        {'uuid': uuid_bar, 'deleted': True, 'task': None},
+    ]
+
+
+@pytest.mark.mysql
+def test_read_task_changes_in_commit_order(admin_db):
+    # Log a change in a transaction that is still open.
+    late_uuid = uuid.uuid4()
+    with admin_db.connection.cursor() as cursor:
+        cursor.execute(
+            '''
+            INSERT INTO task_changes (uuid, deleted, writer)
+            VALUES (%s, True, CONNECTION_ID())
+            ''',
+            (late_uuid.bytes, ),
+        )
+
+    # Create a task meanwhile, which does not wait for that transaction.
+    response = client.post('/task', json={})
+    assert response.status_code == 200
+    uuid_ = response.json()
+    response = client.get('/task/changes')
+    assert response.status_code == 200
+    first_page = response.json()
+    assert [change['uuid'] for change in first_page['changes']] == [uuid_]
+
+    # Commit the open transaction, which takes its sequence number only now.
+    with admin_db.connection.cursor() as cursor:
+        admin_db._DBSession__sequence_task_changes(cursor)  # pylint: disable=protected-access
+    admin_db.connection.commit()
+
+    # Check whether a sync from the token of the first read sees it.
+    response = client.get(f'/task/changes?since={first_page["token"]}')
+    assert response.status_code == 200
+    assert [change['uuid'] for change in response.json()['changes']] == [str(late_uuid)]
+
 ## --------- USERS --------- ##
 
 def test_substitute_user():
-    setup_database()
-
     # Create a user.
     user = {'username': 'john_doe', 'first_name': 'John', 'last_name': 'Doe'}
     response = client.post('/user', json=user)
@@ -247,8 +476,6 @@ def test_substitute_user():
     assert response.status_code == 200
 
 def test_alter_user():
-    setup_database()
-
     # Create a user.
     user = {'username': 'john_doe', 'first_name': 'John', 'last_name': 'Doe'}
     response = client.post('/user', json=user)
@@ -269,15 +496,68 @@ def test_alter_user():
     response = client.delete(f'/user/{username}')
     assert response.status_code == 200
 
-def test_read_nonexistant_user():
-    setup_database()
+def test_create_users_in_bulk(admin_db):
+    # Create a user to be updated by the bulk request.
+    user = {'username': 'john_doe', 'first_name': 'John', 'last_name': 'Doe'}
+    response = client.post('/user', json=user)
+    assert response.status_code == 200
 
+    users = [
+        {'username': 'jane_doe', 'first_name': 'Jane', 'last_name': 'Doe'},
+        {'username': 'john_doe', 'first_name': 'Johnny', 'last_name': 'Doe'},
+        {'first_name': 'Nobody'},
+        {'username': 'x' * 41},
+    ]
+    response = client.post('/user/bulk', json=users)
+    assert response.status_code == 200
+    result = response.json()
+    assert result['upserted'] == ['jane_doe', 'john_doe']
+    assert [error['index'] for error in result['errors']] == [2, 3]
+
+    # Check whether the valid users were saved.
+    for user in users[:2]:
+        response = client.get(f'/user/{user["username"]}')
+        assert response.status_code == 200
+        assert response.json() == user
+
+    # Check whether existence is checked for all users at once.
+    found = admin_db.users_exist(['jane_doe', 'john_doe', 'nobody'])
+    assert found == {'jane_doe', 'john_doe'}
+
+def test_update_users_in_bulk_with_some_fields():
+    user = {'username': 'john_doe', 'first_name': 'John', 'last_name': 'Doe'}
+    response = client.post('/user', json=user)
+    assert response.status_code == 200
+
+    users = [
+        {'username': 'john_doe', 'first_name': 'Johnny'},
+        {'username': 'jane_doe'},
+    ]
+    response = client.post('/user/bulk', json=users)
+    assert response.status_code == 200
+    assert response.json()['upserted'] == ['john_doe', 'jane_doe']
+
+    # Only the sent fields of existing users are updated.
+    response = client.get('/user/john_doe')
+    assert response.json() == {
+        'username': 'john_doe',
+        'first_name': 'Johnny',
+        'last_name': 'Doe',
+    }
+
+    # New users still get the defaults.
+    response = client.get('/user/jane_doe')
+    assert response.json() == {
+        'username': 'jane_doe',
+        'first_name': 'User`s firstname',
+        'last_name': 'User`s lastname',
+    }
+
+def test_read_nonexistant_user():
     response = client.get('/user/random_user')
     assert response.status_code == 404
 
 def test_delete_nonexistant_user():
-    setup_database()
-
     response = client.delete('/user/random_user')
     assert response.status_code == 404
 
@@ -285,8 +565,6 @@ def test_delete_nonexistant_user():
 ## --------- USERS + TASK --------- ##
 
 def test_add_user_to_task():
-    setup_database()
-
     # Create a task.
     task = {'description': 'foo', 'completed': False}
     response = client.post('/task', json=task)
@@ -317,9 +595,69 @@ def test_add_user_to_task():
     response = client.delete(f'/task/{uuid_}')
     assert response.status_code == 200
 
-def test_create_task_with_user():
-    setup_database()
+def test_remove_user_asynchronously():
+    # Create a user with some tasks.
+    user = {'username': 'john_doe', 'first_name': 'John', 'last_name': 'Doe'}
+    response = client.post('/user', json=user)
+    assert response.status_code == 200
+    uuids = []
+    for _ in range(3):
+        response = client.post('/task', json={'user': 'john_doe'})
+        assert response.status_code == 200
+        uuids.append(response.json())
+
+    # Delete the user in the background.
+    response = client.delete('/user/john_doe?async=true')
+    assert response.status_code == 202
+    assert response.json()['tasks_total'] == 3
+
+    # Wait for the deletion to finish in the background.
+    deadline = time.monotonic() + 5
+    while True:
+        response = client.get('/user/john_doe/deletion')
+        assert response.status_code == 200
+        if response.json()['status'] == 'done' or time.monotonic() > deadline:
+            break
+        time.sleep(0.01)
+
+    # Check whether the tasks were detached.
+    assert response.json() == {
+        'username': 'john_doe',
+        'status': 'done',
+        'tasks_total': 3,
+        'tasks_detached': 3,
+    }
+    response = client.get('/user/john_doe')
+    assert response.status_code == 404
+    for uuid_ in uuids:
+        response = client.get(f'/task/{uuid_}')
+        assert response.status_code == 200
+        assert response.json()['user'] is None
 
+def test_remove_user_asynchronously_while_in_progress(admin_db):
+    # Create a user with a task.
+    user = {'username': 'john_doe', 'first_name': 'John', 'last_name': 'Doe'}
+    response = client.post('/user', json=user)
+    assert response.status_code == 200
+    response = client.post('/task', json={'user': 'john_doe'})
+    assert response.status_code == 200
+
+    # Start a deletion that has not run yet.
+    admin_db.start_user_deletion('john_doe')
+
+    # Check whether a second deletion is refused and leaves the first alone.
+    response = client.delete('/user/john_doe?async=true')
+    assert response.status_code == 409
+    response = client.get('/user/john_doe/deletion')
+    assert response.status_code == 200
+    assert response.json() == {
+        'username': 'john_doe',
+        'status': 'pending',
+        'tasks_total': 1,
+        'tasks_detached': 0,
+    }
+
+def test_create_task_with_user():
     # Create a user.
     user = {'username': 'john_doe', 'first_name': 'John', 'last_name': 'Doe'}
     response = client.post('/user', json=user)
@@ -345,4 +683,261 @@ def test_create_task_with_user():
     # Delete the task.
     response = client.delete(f'/task/{uuid_}')
     assert response.status_code == 200
-    
\ No newline at end of file
+    
+
+
+## --------- SERVICE --------- ##
+
+def test_read_metrics():
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert 'allowed' in response.json()['rate_limit']
+    assert 'collapsed' in response.json()['coalesced_reads']
+
+
+@pytest.mark.mysql
+def test_health_probes():
+    response = client.get('/health/live')
+    assert response.status_code == 200
+    response = client.get('/health/ready')
+    assert response.status_code == 200
+
+
+@pytest.mark.mysql
+def test_read_database_metrics():
+    response = client.get('/task')
+    assert response.status_code == 200
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    database = response.json()['database']
+    assert database['circuit_breaker']['state'] == 'closed'
+    assert database['admission']['in_flight'] == 0
+
+
+def test_too_many_database_requests():
+    app.dependency_overrides[get_db_guards] = lambda: (
+        CircuitBreaker(),
+        AdmissionQueue(max_in_flight=0, max_queue=0),
+    )
+    try:
+        response = client.get('/task')
+    finally:
+        del app.dependency_overrides[get_db_guards]
+    assert response.status_code == 503
+    assert response.headers['retry-after'] == '1'
+
+
+@pytest.mark.mysql
+def test_database_unavailable_while_circuit_open():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure(time.monotonic())
+    app.dependency_overrides[get_db_guards] = lambda: (breaker, AdmissionQueue())
+    try:
+        response = client.get('/task')
+    finally:
+        del app.dependency_overrides[get_db_guards]
+    assert response.status_code == 503
+    assert int(response.headers['retry-after']) >= 1
+    assert breaker.rejected == 1
+
+
+def test_slow_responses_do_not_count_as_slow_database_calls():
+    breaker = CircuitBreaker(failure_threshold=1, slow_call_seconds=0.05)
+    admission = AdmissionQueue()
+    in_flight = []
+
+    slow_app = FastAPI()
+    slow_app.dependency_overrides = {
+        **app.dependency_overrides,
+        get_db_guards: lambda: (breaker, admission),
+    }
+
+    @slow_app.get('/task')
+    def read_tasks(
+            background_tasks: BackgroundTasks,
+            db: DBSession = Depends(get_db, scope='function'),
+    ):
+        tasks = db.read_tasks()
+
+        def stream():
+            time.sleep(0.1)
+            yield json.dumps({str(uuid_): task.dict() for uuid_, task in tasks.items()})
+
+        def run_job():
+            in_flight.append(admission.in_flight)
+            time.sleep(0.1)
+
+        background_tasks.add_task(run_job)
+        return StreamingResponse(stream(), media_type='application/json')
+
+    response = TestClient(slow_app).get('/task')
+    assert response.status_code == 200
+    assert response.json() == {}
+
+    # The session and its admission slot are released before the response.
+    assert in_flight == [0]
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.slow_calls == 0
+
+
+def test_database_overload_returns_service_unavailable():
+    class OverloadedSession:
+        def __getattr__(self, name):
+            def overloaded(*args, **kwargs):
+                raise conn.errors.OperationalError(msg='Lost connection', errno=2013)
+            return overloaded
+
+    previous = app.dependency_overrides.get(get_db)
+    app.dependency_overrides[get_db] = OverloadedSession
+    try:
+        response = client.get('/task')
+    finally:
+        if previous is None:
+            del app.dependency_overrides[get_db]
+        else:
+            app.dependency_overrides[get_db] = previous
+    assert response.status_code == 503
+    assert response.headers['retry-after'] == '1'
+
+
+def test_middleware_reads_overridden_config(tmp_path):
+    config_file = tmp_path / 'config.json'
+    config_file.write_text(json.dumps({'compression': {'minimum_size': 0}}))
+
+    configured_app = FastAPI()
+
+    @configured_app.get('/task')
+    async def read_tasks():
+        return {}
+
+    configured_app.add_middleware(ConfiguredMiddleware)
+    configured_app.dependency_overrides[utils.get_config_filename] = \
+        lambda: str(config_file)
+    configured_client = TestClient(configured_app)
+
+    # Even the smallest response is compressed with that config.
+    response = configured_client.get('/task', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['content-encoding'] == 'gzip'
+    assert response.json() == {}
+
+
+def test_rate_limit_returns_too_many_requests():
+    limited_app = FastAPI()
+
+    @limited_app.get('/task')
+    async def read_tasks():
+        return {}
+
+    @limited_app.get('/task/{uuid_}')
+    async def read_task(uuid_: str):
+        return {}
+
+    limited_app.add_middleware(RateLimitMiddleware, capacity=10, refill_rate=1)
+    limited_client = TestClient(limited_app)
+
+    # A full listing costs as much as the whole bucket.
+    response = limited_client.get('/task')
+    assert response.status_code == 200
+    response = limited_client.get('/task/foo')
+    assert response.status_code == 429
+    assert int(response.headers['retry-after']) >= 1
+
+    # Limited paths without a cost of their own are counted together.
+    response = limited_client.get('/task/bar')
+    assert response.status_code == 429
+    response = limited_client.get('/task')
+    assert response.status_code == 429
+    assert metrics.collect()['rate_limit']['limited_by_route'] == {
+        'GET /task': 1,
+        'other': 2,
+    }
+
+
+def test_rate_limit_evicts_least_recently_used_buckets():
+    backend = InMemoryBackend(capacity=10, refill_rate=1, max_buckets=2)
+
+    async def acquire_all(keys):
+        for key in keys:
+            await backend.acquire(key, 1)
+
+    asyncio.run(acquire_all(['foo', 'bar', 'foo', 'baz']))
+    assert list(backend.buckets) == ['foo', 'baz']
+    assert backend.metrics() == {'buckets': 2, 'evicted': 1}
+
+
+def test_rate_limit_backend_must_implement_acquire():
+    class IncompleteBackend(RateLimitBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteBackend()
+
+
+def test_profile_request(tmp_path):
+    profiled_app = FastAPI()
+    other_started = threading.Event()
+
+    def read_items():
+        time.sleep(0.05)
+        return []
+
+    @profiled_app.get('/task')
+    def read_tasks(items: list = Depends(read_items)):
+        time.sleep(0.05)
+        return {}
+
+    @profiled_app.get('/user')
+    def read_users():
+        other_started.set()
+        time.sleep(0.3)
+        return {}
+
+    output_file = tmp_path / 'profile.folded'
+    profiled_app.add_middleware(
+        ProfilingMiddleware,
+        profiler=SamplingProfiler(interval=0.001),
+        token='secret',
+        sample_rate=1,
+        output_file=str(output_file),
+    )
+    profiled_client = TestClient(profiled_app)
+
+    # Without the token the request is served as usual, and sampled.
+    response = profiled_client.get('/task?profile=1')
+    assert response.status_code == 200
+    assert response.json() == {}
+
+    # With the token the folded stacks are returned instead, dependencies
+    # included.
+    response = profiled_client.get(
+        '/task?profile=1',
+        headers={'X-Profiling-Token': 'secret'},
+    )
+    assert response.status_code == 200
+    assert response.headers['x-profile-status'] == '200'
+    assert 'read_tasks' in response.text
+    assert 'read_items' in response.text
+
+    # A request running alongside is left out.
+    other = threading.Thread(target=profiled_client.get, args=('/user', ))
+    other.start()
+    other_started.wait(5)
+    response = profiled_client.get(
+        '/task?profile=1',
+        headers={'X-Profiling-Token': 'secret'},
+    )
+    other.join()
+    assert response.status_code == 200
+    assert 'read_users' not in response.text
+
+    # The sampled requests are dumped with the token only.
+    response = profiled_client.post('/profiling/dump')
+    assert response.status_code == 403
+    response = profiled_client.post(
+        '/profiling/dump',
+        headers={'X-Profiling-Token': 'secret'},
+    )
+    assert response.status_code == 200
+    assert response.json()['samples'] > 0
+    assert 'read_tasks' in output_file.read_text()
@@ -0,0 +1,150 @@
+# pylint: disable=missing-module-docstring, missing-function-docstring, missing-class-docstring
+import threading
+import time
+
+import pytest
+
+from tasklist.coalescing import SingleFlight, coalesced, invalidates
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.001)
+
+
+def run_in_threads(count, function):
+    results = [None] * count
+
+    def run(index):
+        try:
+            results[index] = function()
+        except Exception as exception:  # pylint: disable=broad-except
+            results[index] = exception
+
+    threads = [threading.Thread(target=run, args=(index, )) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+class BlockedCall:
+    """Stands for a query that only finishes when released."""
+
+    def __init__(self, result=None, exception=None):
+        self.released = threading.Event()
+        self.calls = 0
+        self.result = result
+        self.exception = exception
+
+    def __call__(self):
+        self.calls += 1
+        self.released.wait(5)
+        if self.exception is not None:
+            raise self.exception
+        return self.result
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    call = BlockedCall(result=['foo'])
+
+    threads, results = run_in_threads(5, lambda: flight.do('key', call))
+    wait_until(lambda: flight.collapsed == 4)
+    call.released.set()
+    for thread in threads:
+        thread.join()
+
+    assert call.calls == 1
+    assert all(result is call.result for result in results)
+    assert flight.metrics() == {'executed': 1, 'collapsed': 4, 'invalidations': 0}
+
+    # Once finished, the next call runs again.
+    assert flight.do('key', lambda: ['bar']) == ['bar']
+    assert flight.executed == 2
+
+
+def test_exception_reaches_every_waiter():
+    flight = SingleFlight()
+    call = BlockedCall(exception=ValueError('foo'))
+
+    threads, results = run_in_threads(3, lambda: flight.do('key', call))
+    wait_until(lambda: flight.collapsed == 2)
+    call.released.set()
+    for thread in threads:
+        thread.join()
+
+    assert call.calls == 1
+    assert all(result is call.exception for result in results)
+    assert not flight.calls
+
+
+def test_invalidate_makes_later_calls_run_again():
+    flight = SingleFlight()
+    stale = BlockedCall(result='stale')
+
+    threads, results = run_in_threads(2, lambda: flight.do('key', stale))
+    wait_until(lambda: flight.collapsed == 1)
+
+    # A write finishes while the read is in flight.
+    flight.invalidate()
+    assert flight.do('key', lambda: 'fresh') == 'fresh'
+
+    stale.released.set()
+    for thread in threads:
+        thread.join()
+
+    # Callers that arrived before the write keep the in-flight result.
+    assert results == ['stale', 'stale']
+    assert flight.metrics() == {'executed': 2, 'collapsed': 1, 'invalidations': 1}
+
+
+class Session:
+    def __init__(self, single_flight=None):
+        self.single_flight = single_flight
+        self.calls = []
+        self.blocked = BlockedCall()
+
+    @coalesced
+    def read(self, key, wait=False):
+        self.calls.append(key)
+        if wait:
+            self.blocked()
+        return [key]
+
+    @invalidates
+    def write(self, fail=False):
+        if fail:
+            raise KeyError()
+
+
+def test_coalesced_calls_share_results_by_arguments():
+    session = Session(SingleFlight())
+
+    threads, results = run_in_threads(4, lambda: session.read('foo', wait=True))
+    wait_until(lambda: session.single_flight.collapsed == 3)
+    # Other arguments are a different read.
+    assert session.read('bar') == ['bar']
+    session.blocked.released.set()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(session.calls) == ['bar', 'foo']
+    assert all(result == ['foo'] for result in results)
+
+
+def test_coalesced_calls_run_directly_without_single_flight():
+    session = Session()
+    assert session.read('foo') == ['foo']
+    assert session.read('foo') == ['foo']
+    assert session.calls == ['foo', 'foo']
+    session.write()
+
+
+def test_writes_invalidate_even_when_failing():
+    session = Session(SingleFlight())
+    session.write()
+    with pytest.raises(KeyError):
+        session.write(fail=True)
+    assert session.single_flight.invalidations == 2
@@ -0,0 +1,168 @@
+# pylint: disable=missing-module-docstring, missing-function-docstring
+import asyncio
+import threading
+import time
+
+from tasklist.overload import AdmissionQueue, CircuitBreaker
+
+## --------- CIRCUIT BREAKER --------- ##
+
+def trip(breaker):
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow()
+        breaker.record_failure(time.monotonic())
+
+
+def test_breaker_trips_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+
+    # A success in between starts the count again.
+    breaker.record_failure(time.monotonic())
+    breaker.record_failure(time.monotonic())
+    breaker.record_success(time.monotonic())
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    trip(breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.retry_after() > 0
+    assert breaker.metrics() == {
+        'state': 'open',
+        'failures': 5,
+        'slow_calls': 0,
+        'rejected': 1,
+        'trips': 1,
+    }
+
+
+def test_breaker_counts_slow_calls_as_failures():
+    breaker = CircuitBreaker(failure_threshold=1, slow_call_seconds=0.01)
+    breaker.record_success(time.monotonic() - 1)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.slow_calls == 1
+
+
+def test_breaker_ignores_calls_started_before_it_opened():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    started = time.monotonic()
+    trip(breaker)
+
+    # A request that was already running succeeds after the trip.
+    breaker.record_success(started)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    # Once half open, only the probe decides.
+    time.sleep(0.06)
+    probe_started = time.monotonic()
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success(started)
+    breaker.record_failure(started)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.record_success(probe_started)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_breaker_opens_again_when_probe_fails():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    trip(breaker)
+
+    time.sleep(0.06)
+    probe_started = time.monotonic()
+    assert breaker.allow()
+    breaker.record_failure(probe_started)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.trips == 2
+
+## --------- ADMISSION QUEUE --------- ##
+
+def test_admission_queues_then_rejects():
+    admission = AdmissionQueue(max_in_flight=1, max_queue=1, timeout=5)
+
+    async def run():
+        assert await admission.acquire()
+        waiting = asyncio.create_task(admission.acquire())
+        await asyncio.sleep(0)
+        assert admission.metrics()['waiting'] == 1
+
+        # The queue is full.
+        assert not await admission.acquire()
+
+        # Releasing hands the slot to the waiting caller.
+        admission.release()
+        assert await waiting
+        assert admission.metrics() == {
+            'in_flight': 1,
+            'waiting': 0,
+            'rejected': 1,
+            'timed_out': 0,
+        }
+        admission.release()
+
+    asyncio.run(run())
+    assert admission.in_flight == 0
+
+
+def test_admission_times_out():
+    admission = AdmissionQueue(max_in_flight=1, max_queue=1, timeout=0.01)
+
+    async def run():
+        assert await admission.acquire()
+        assert not await admission.acquire()
+        admission.release()
+
+    asyncio.run(run())
+    assert admission.metrics() == {
+        'in_flight': 0,
+        'waiting': 0,
+        'rejected': 0,
+        'timed_out': 1,
+    }
+
+
+def test_admission_passes_on_slots_of_cancelled_callers():
+    admission = AdmissionQueue(max_in_flight=1, max_queue=2, timeout=5)
+
+    async def run():
+        assert await admission.acquire()
+        cancelled = asyncio.create_task(admission.acquire())
+        waiting = asyncio.create_task(admission.acquire())
+        await asyncio.sleep(0)
+
+        # The first caller goes away just as the slot is handed to it.
+        cancelled.cancel()
+        admission.release()
+        assert await waiting
+        admission.release()
+
+    asyncio.run(run())
+    assert admission.metrics()['in_flight'] == 0
+
+
+def test_admission_across_event_loops():
+    # Each thread runs its own event loop, as with one loop per test request.
+    admission = AdmissionQueue(max_in_flight=1, max_queue=1, timeout=5)
+    acquired = threading.Event()
+    results = []
+
+    def hold():
+        async def run():
+            assert await admission.acquire()
+            acquired.set()
+            await asyncio.sleep(0.05)
+            admission.release()
+        asyncio.run(run())
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    acquired.wait(5)
+    results.append(asyncio.run(admission.acquire()))
+    holder.join()
+    admission.release()
+
+    assert results == [True]
+    assert admission.in_flight == 0
@@ -1,4 +1,5 @@
 # pylint:disable=missing-module-docstring, missing-function-docstring
+import hashlib
 import json
 import os
 import os.path
@@ -42,19 +43,23 @@ def get_admin_secrets_filename():
     )
 
 
-def run_script(filename_script, filename_config, filename_secrets):
-    with open(filename_script, 'r') as file:
-        script = file.read()
+def connect(filename_config, filename_secrets):
     with open(filename_config, 'r') as file:
         config = json.load(file)
     with open(filename_secrets, 'r') as file:
         secrets = json.load(file)
-    conn = cnt.connect(
+    return cnt.connect(
         host=config['db_host'],
         database=config['database'],
         user=secrets['user'],
         password=secrets['password'],
     )
+
+
+def run_script(filename_script, filename_config, filename_secrets):
+    with open(filename_script, 'r') as file:
+        script = file.read()
+    conn = connect(filename_config, filename_secrets)
     with conn.cursor() as cursor:
         # One has to iterate through the results to get them executed properly
         # when using multi=True in this library. Makes sense after reflecting
@@ -78,3 +83,99 @@ def run_all_scripts(scripts_dir, filename_config, filename_secrets):
             filename_config,
             filename_secrets,
         )
+
+
+def get_migrations_dir():
+    return os.path.join(
+        os.path.dirname(__file__),
+        '..',
+        'database',
+        'migrations',
+    )
+
+
+def list_tables(cursor, database):
+    cursor.execute(
+        '''
+        SELECT table_name FROM information_schema.tables
+        WHERE table_schema = %s AND table_type = 'BASE TABLE'
+        AND table_name NOT LIKE '\\_template%%'
+        ''',
+        (database, ),
+    )
+    return [table for table, in cursor.fetchall()]
+
+
+def prepare_template_database(scripts_dir, filename_config, filename_secrets):
+    # Migrates the template only when the migrations changed since the last
+    # run. The lock keeps parallel test workers from migrating it together.
+    digest = hashlib.sha256()
+    for filename in sorted(os.listdir(scripts_dir)):
+        if filename.endswith('.sql'):
+            with open(os.path.join(scripts_dir, filename), 'rb') as file:
+                digest.update(file.read())
+    stamp = digest.hexdigest()
+
+    conn = connect(filename_config, filename_secrets)
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT GET_LOCK('tasklist_template', 300)")
+        cursor.fetchone()
+        try:
+            cursor.execute(
+                'CREATE TABLE IF NOT EXISTS _template_stamp (stamp CHAR(64))'
+            )
+            cursor.execute('SELECT stamp FROM _template_stamp')
+            if cursor.fetchall() != [(stamp, )]:
+                run_all_scripts(scripts_dir, filename_config, filename_secrets)
+                cursor.execute('DELETE FROM _template_stamp')
+                cursor.execute('INSERT INTO _template_stamp VALUES (%s)', (stamp, ))
+                conn.commit()
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK('tasklist_template')")
+            cursor.fetchone()
+    conn.close()
+
+
+def clone_database(target, filename_config, filename_secrets):
+    with open(filename_config, 'r') as file:
+        template = json.load(file)['database']
+    conn = connect(filename_config, filename_secrets)
+    with conn.cursor() as cursor:
+        cursor.execute(f'DROP DATABASE IF EXISTS `{target}`')
+        cursor.execute(f'CREATE DATABASE `{target}`')
+        cursor.execute('SET FOREIGN_KEY_CHECKS = 0')
+        for table in list_tables(cursor, template):
+            # CREATE TABLE ... LIKE would leave the foreign keys behind.
+            cursor.execute(f'SHOW CREATE TABLE `{template}`.`{table}`')
+            create_table = cursor.fetchone()[1]
+            cursor.execute(f'USE `{target}`')
+            cursor.execute(create_table)
+            cursor.execute(
+                f'INSERT INTO `{target}`.`{table}` SELECT * FROM `{template}`.`{table}`'
+            )
+    conn.commit()
+    conn.close()
+
+
+def drop_database(target, filename_config, filename_secrets):
+    conn = connect(filename_config, filename_secrets)
+    with conn.cursor() as cursor:
+        cursor.execute(f'DROP DATABASE IF EXISTS `{target}`')
+    conn.close()
+
+
+def reset_database(template, filename_config, filename_secrets):
+    # Much cheaper than running the migrations again: empties every table and
+    # copies back the rows the migrations seed.
+    with open(filename_config, 'r') as file:
+        database = json.load(file)['database']
+    conn = connect(filename_config, filename_secrets)
+    with conn.cursor() as cursor:
+        cursor.execute('SET FOREIGN_KEY_CHECKS = 0')
+        for table in list_tables(cursor, database):
+            cursor.execute(f'TRUNCATE TABLE `{table}`')
+            cursor.execute(f'INSERT INTO `{table}` SELECT * FROM `{template}`.`{table}`')
+        cursor.execute('SET FOREIGN_KEY_CHECKS = 1')
+    conn.commit()
+    conn.close()
+